@@ -6,9 +6,21 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import json
 import io
+import hashlib
+import os
+import queue
+import atexit
+import uuid
+import sqlite3
+import threading
+import time
 from datetime import datetime
 import base64
+import string
+from openpyxl import load_workbook
+import xlrd
 from scipy import stats
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from scipy.interpolate import interp1d, UnivariateSpline
 import warnings
 warnings.filterwarnings('ignore')
@@ -195,6 +207,11 @@ def load_sample_data():
     }
     return sample_standards
 
+@st.cache_data
+def normal_quantiles(n):
+    """Q-Q график учун назарий нормал квантиллар (Blom ўринлари)"""
+    return stats.norm.ppf((np.arange(1, n + 1) - 0.375) / (n + 0.25))
+
 # ==================== ХЕЛПЕР ФУНКЦИЯЛАРИ ====================
 def create_download_link(df, filename, text):
     """CSV файл учун юклаш линки яратиш"""
@@ -203,8 +220,14 @@ def create_download_link(df, filename, text):
     href = f'<a href="data:file/csv;base64,{b64}" download="{filename}.csv">{text}</a>'
     return href
 
-def calculate_regression(x, y):
+WEIGHTING_SCHEMES = ('none', '1/x', '1/x²', '1/y²')
+
+def calculate_regression(x, y, weighting='none'):
     """Регрессия ҳисоблаш"""
+    if weighting != 'none':
+        batch = weighted_regression_batch(np.atleast_2d(x), np.atleast_2d(y), weighting)
+        return {name: float(values[0]) for name, values in batch.items() if name != 'n'}
+    
     slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
     return {
         'slope': slope,
@@ -214,6 +237,112 @@ def calculate_regression(x, y):
         'std_err': std_err
     }
 
+def regression_weights(x, y, weighting):
+    """Гетероскедастик маълумотлар учун вазнлар (NaN ва нотўғри нуқталар 0 вазн олади)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if weighting == 'none':
+            w = np.ones_like(x, dtype=float)
+        elif weighting == '1/x':
+            w = 1.0 / np.abs(x)
+        elif weighting == '1/x²':
+            w = 1.0 / x**2
+        elif weighting == '1/y²':
+            w = 1.0 / y**2
+        else:
+            raise ValueError(f"Номаълум вазн схемаси: {weighting}")
+    w[~np.isfinite(w) | np.isnan(x) | np.isnan(y)] = 0.0
+    return w
+
+def weighted_regression_batch(x, y, weighting='none'):
+    """Планшетлар × стандартлар матрицалари учун вазнли чизиқли регрессия (битта стек ечим)"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = regression_weights(x, y, weighting)
+    x0 = np.where(w > 0, x, 0.0)
+    y0 = np.where(w > 0, y, 0.0)
+    
+    # Нормал тенгламалар: (AᵀWA) β = AᵀWy, A = [x, 1], ҳар бир планшет учун 2×2 тизим
+    sw = w.sum(axis=1)
+    swx = (w * x0).sum(axis=1)
+    swxx = (w * x0 * x0).sum(axis=1)
+    lhs = np.stack([np.stack([swxx, swx], axis=-1), np.stack([swx, sw], axis=-1)], axis=-2)
+    rhs = np.stack([(w * x0 * y0).sum(axis=1), (w * y0).sum(axis=1)], axis=-1)
+    
+    n = (w > 0).sum(axis=1)
+    # det / (Σwx²·Σw) = 1 - (Σwx)²/(Σwx²·Σw): вазн ва OD масштабига боғлиқ эмас
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_det = np.linalg.det(lhs) / (swxx * sw)
+    solvable = (n >= 3) & (relative_det > 1e-12)
+    lhs[~solvable] = np.eye(2)
+    beta = np.linalg.solve(lhs, rhs[..., None])[..., 0]
+    slope, intercept = beta[:, 0], beta[:, 1]
+    
+    residuals = np.where(w > 0, y0 - (slope[:, None] * x0 + intercept[:, None]), 0.0)
+    ss_res = (w * residuals**2).sum(axis=1)
+    y_mean = np.divide((w * y0).sum(axis=1), sw, out=np.zeros_like(sw), where=sw > 0)
+    ss_tot = (w * np.where(w > 0, y0 - y_mean[:, None], 0.0)**2).sum(axis=1)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dof = n - 2
+        sigma2 = ss_res / dof
+        cov_scale = sigma2 / np.linalg.det(lhs)
+        std_err = np.sqrt(cov_scale * sw)
+        intercept_err = np.sqrt(cov_scale * swxx)
+        r_squared = 1.0 - ss_res / ss_tot
+        p_value = 2 * stats.t.sf(np.abs(slope / std_err), dof)
+    
+    result = {
+        'slope': slope,
+        'intercept': intercept,
+        'r_squared': r_squared,
+        'p_value': p_value,
+        'std_err': std_err,
+        'intercept_err': intercept_err,
+        'n': n
+    }
+    for name in ('slope', 'intercept', 'r_squared', 'p_value', 'std_err', 'intercept_err'):
+        result[name] = np.where(solvable, result[name], np.nan)
+    return result
+
+def plate_standard_matrix(plate_df):
+    """Импорт қилинган стандартлардан планшетлар × концентрациялар OD матрицаси"""
+    standards = plate_df[(plate_df['Роль'] == 'Стандарт') & plate_df['Концентрация'].notna()]
+    pivot = standards.pivot_table(
+        index='Планшет',
+        columns='Концентрация',
+        values='Оптик зичлик',
+        aggfunc='mean'
+    )
+    concentrations = np.broadcast_to(pivot.columns.to_numpy(dtype=float), pivot.shape)
+    return pivot.index.to_numpy(), pivot.to_numpy(dtype=float), concentrations
+
+CURVE_TABLE_POINTS = 512  # тескари жадвалдаги концентрация нуқталари сони
+
+def build_curve_table(f, od_range, points=CURVE_TABLE_POINTS):
+    """Калибровка функциясидан концентрация тўри бўйича OD ва dOD/dC жадвали"""
+    od_fine = np.linspace(od_range[0], od_range[1], 4 * points)
+    conc_fine = np.asarray(f(od_fine), dtype=float)
+    low, high = conc_fine.min(), conc_fine.max()
+    concentration = np.linspace(low, high, points)
+    
+    # Ҳар бир концентрацияни эгри чизиқ неча марта кесиб ўтади (четлар ичкарига сурилади)
+    target = np.clip(concentration, low + 1e-9 * (high - low), high - 1e-9 * (high - low))
+    above = conc_fine[None, :] >= target[:, None]
+    crossings = above[:, :-1] != above[:, 1:]
+    unique = crossings.sum(axis=1) == 1
+    
+    # Ягона кесишма сегментида чизиқли интерполяция; монотон бўлмаган (cubic/spline) қисмлар NaN
+    k = crossings.argmax(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (target - conc_fine[k]) / (conc_fine[k + 1] - conc_fine[k])
+    optic_density = np.where(unique, od_fine[k] + fraction * (od_fine[k + 1] - od_fine[k]), np.nan)
+    return {
+        'concentration': concentration,
+        'optic_density': optic_density,
+        'slope': np.gradient(optic_density, concentration),
+        'monotonic': bool(unique.all())
+    }
+
 # ==================== АСОСИЙ КЛАССЛАР ====================
 class HormoneCalibrator:
     """Гормон калибратор класси"""
@@ -256,7 +385,8 @@ class HormoneCalibrator:
             'function': f,
             'method': method,
             'range': (min(x), max(x)),
-            'regression': calculate_regression(x, y)
+            'regression': calculate_regression(x, y),
+            'table': build_curve_table(f, (min(x), max(x)))
         }
         
         return self.calibration_data[hormone_name]
@@ -280,8 +410,1419 @@ class HormoneCalibrator:
         status[od_array > max_od] = 1   # Юкори диапазон
         
         return predictions, status
+    
+    def predict_uncertainty(self, hormone_name, optic_density_values, **settings):
+        """OD шовқини ва пипетлаш CV дан концентрация ноаниқлиги (Монте-Карло)"""
+        if hormone_name not in self.calibration_data:
+            self.calibrate(hormone_name)
+        
+        return monte_carlo_uncertainty(
+            self.calibration_data[hormone_name]['function'],
+            optic_density_values,
+            **settings
+        )
+    
+    def _curve_table(self, hormone_name):
+        if hormone_name not in self.calibration_data:
+            self.calibrate(hormone_name)
+        return self.calibration_data[hormone_name]['table']
+    
+    def optic_density_for(self, hormone_name, concentration_values):
+        """Концентрацияга (масалан, клиник қарор чегарасига) мос OD"""
+        table = self._curve_table(hormone_name)
+        return np.interp(concentration_values, table['concentration'], table['optic_density'], left=np.nan, right=np.nan)
+    
+    def local_slope(self, hormone_name, concentration_values):
+        """Эгри чизиқнинг берилган концентрациядаги қиялиги (dOD/dC)"""
+        table = self._curve_table(hormone_name)
+        return np.interp(concentration_values, table['concentration'], table['slope'], left=np.nan, right=np.nan)
+    
+    def precision_profile(self, hormone_name, od_sd=None, pipetting_cv=None):
+        """Концентрация тўри бўйича кутилаётган CV % (OD шовқини ва пипетлаш CV дан)"""
+        table = self._curve_table(hormone_name)
+        od_sd = UNCERTAINTY_DEFAULTS['od_sd'] if od_sd is None else od_sd
+        pipetting_cv = UNCERTAINTY_DEFAULTS['pipetting_cv'] if pipetting_cv is None else pipetting_cv
+        
+        # monte_carlo_uncertainty билан бир хил модел: пипетлаш OD ни нисбий, ридер эса абсолют бузади
+        concentration = table['concentration']
+        od_noise = np.sqrt(od_sd**2 + (pipetting_cv * table['optic_density'])**2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = 100 * od_noise / np.abs(table['slope'] * concentration)
+        return concentration, np.where(concentration > 0, cv, np.nan)
+    
+    def calibrate_all(self, method='linear'):
+        """Барча стандартларни бир йўла калибровка қилиш (method - усул ёки гормон -> усул)"""
+        methods = method if isinstance(method, dict) else dict.fromkeys(self.standards, method)
+        return {name: self.calibrate(name, methods.get(name, 'linear')) for name in self.standards}
+    
+    def predict_all(self, hormone_names, od_matrix):
+        """Беморлар × гормонлар OD матрицасидан концентрацияларни прогноз қилиш"""
+        od_matrix = np.asarray(od_matrix, dtype=float)
+        predictions = np.full(od_matrix.shape, np.nan)
+        status = np.zeros(od_matrix.shape, dtype=int)
+        
+        for j, name in enumerate(hormone_names):
+            column = od_matrix[:, j]
+            measured = ~np.isnan(column)
+            if measured.any():
+                predictions[measured, j], status[measured, j] = self.predict(name, column[measured])
+        
+        return predictions, status
+
+# ==================== QC ТРЕНД САҚЛАШ ====================
+QC_DB_PATH = os.environ.get('BIOLAB_QC_DB', 'biolab_qc.db')
+QC_MIN_BASELINE = 10     # Westgard қоидалари бошланиши учун минимал ўлчовлар сони
+QC_HISTORY_WINDOW = 10   # 10x қоидаси учун сақланадиган охирги z қийматлар
+QC_REJECT_RULES = ('1_3s', '2_2s', 'R_4s', '4_1s', '10x')
+QC_CURVE_SERIES = ('slope', 'intercept', 'r_squared')
+
+def evaluate_westgard(z, recent_z):
+    """Янги z қиймат ва олдинги z лар бўйича Westgard мульти-қоидалари"""
+    seq = list(recent_z) + [z]
+    flags = []
+    
+    if abs(z) > 3:
+        flags.append('1_3s')
+    elif abs(z) > 2:
+        flags.append('1_2s')
+    
+    if len(seq) >= 2:
+        prev = seq[-2]
+        if (z > 2 and prev > 2) or (z < -2 and prev < -2):
+            flags.append('2_2s')
+        if max(z, prev) > 2 and min(z, prev) < -2:
+            flags.append('R_4s')
+    
+    last4 = seq[-4:]
+    if len(last4) == 4 and (all(v > 1 for v in last4) or all(v < -1 for v in last4)):
+        flags.append('4_1s')
+    
+    last10 = seq[-10:]
+    if len(last10) == 10 and (all(v > 0 for v in last10) or all(v < 0 for v in last10)):
+        flags.append('10x')
+    
+    return flags
+
+class QCStore:
+    """Назорат натижалари ва калибровка параметрларининг вақт бўйича индексланган омбори"""
+    
+    def __init__(self, path=QC_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS qc_results (
+                run_time TEXT NOT NULL,
+                hormone TEXT NOT NULL,
+                series TEXT NOT NULL,
+                value REAL NOT NULL,
+                z REAL,
+                mean REAL,
+                sd REAL,
+                flags TEXT NOT NULL DEFAULT '',
+                method TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_qc_results_series
+                ON qc_results (hormone, series, run_time);
+            CREATE TABLE IF NOT EXISTS kit_lots (
+                hormone TEXT NOT NULL,
+                lot TEXT NOT NULL,
+                recorded TEXT NOT NULL,
+                optic_density TEXT NOT NULL,
+                concentration TEXT NOT NULL,
+                PRIMARY KEY (hormone, lot)
+            );
+            CREATE TABLE IF NOT EXISTS qc_state (
+                hormone TEXT NOT NULL,
+                series TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                mean REAL NOT NULL,
+                m2 REAL NOT NULL,
+                recent_z TEXT NOT NULL,
+                PRIMARY KEY (hormone, series)
+            );
+        """)
+        self._conn.commit()
+    
+    def _evaluate(self, hormone, series, value):
+        """Битта қийматни жорий ҳолат бўйича баҳолаш ва ҳолатни янгилаш (Welford)"""
+        row = self._conn.execute(
+            "SELECT n, mean, m2, recent_z FROM qc_state WHERE hormone = ? AND series = ?",
+            (hormone, series)
+        ).fetchone()
+        n, mean, m2, recent_z = row if row else (0, 0.0, 0.0, '[]')
+        recent_z = json.loads(recent_z)
+        
+        z, flags, target_mean, sd = None, [], None, None
+        if n >= QC_MIN_BASELINE:
+            target_mean, sd = mean, np.sqrt(m2 / (n - 1))
+            if sd > 0:
+                z = (value - mean) / sd
+                flags = evaluate_westgard(z, recent_z)
+                recent_z = (recent_z + [z])[-(QC_HISTORY_WINDOW - 1):]
+        
+        # Рад этилган қийматлар мақсадли ўртача ва SD ни бузмаслиги керак
+        if not any(flag in QC_REJECT_RULES for flag in flags):
+            n += 1
+            delta = value - mean
+            mean += delta / n
+            m2 += delta * (value - mean)
+        
+        self._conn.execute(
+            "INSERT OR REPLACE INTO qc_state VALUES (?, ?, ?, ?, ?, ?)",
+            (hormone, series, n, mean, m2, json.dumps(recent_z))
+        )
+        return z, target_mean, sd, flags
+    
+    def record_run(self, hormone, regression, controls=None, method='linear', run_time=None):
+        """Янги калибровка ва назорат натижаларини қўшиш, қоидаларни инкрементал баҳолаш"""
+        run_time = (run_time or datetime.now()).isoformat(timespec='seconds')
+        values = {name: regression[name] for name in QC_CURVE_SERIES}
+        values.update(controls or {})
+        
+        evaluation = {}
+        with self._lock:
+            for series, value in values.items():
+                if value is None or not np.isfinite(value):
+                    continue
+                z, mean, sd, flags = self._evaluate(hormone, series, float(value))
+                self._conn.execute(
+                    "INSERT INTO qc_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_time, hormone, series, float(value), z, mean, sd, ','.join(flags), method)
+                )
+                evaluation[series] = {'z': z, 'flags': flags}
+            self._conn.commit()
+        
+        return evaluation
+    
+    def series(self, hormone):
+        """Гормон учун кузатилаётган серияларни қайтариш"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT series FROM qc_state WHERE hormone = ? ORDER BY series", (hormone,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def history(self, hormone, series, since=None, until=None):
+        """Серия тарихини вақт оралиғи бўйича олиш (индекс орқали)"""
+        query = "SELECT run_time, value, z, mean, sd, flags FROM qc_results WHERE hormone = ? AND series = ?"
+        params = [hormone, series]
+        if since is not None:
+            query += " AND run_time >= ?"
+            params.append(since.isoformat(timespec='seconds'))
+        if until is not None:
+            query += " AND run_time <= ?"
+            params.append(until.isoformat(timespec='seconds'))
+        query += " ORDER BY run_time"
+        
+        with self._lock:
+            df = pd.read_sql_query(query, self._conn, params=params)
+        df['run_time'] = pd.to_datetime(df['run_time'])
+        return df
+    
+    def save_lot(self, hormone, lot, optic_density, concentration):
+        """Кит лоти стандарт эгри чизиғини сақлаш (бир лот - бир ёзув)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kit_lots VALUES (?, ?, ?, ?, ?)",
+                (
+                    hormone,
+                    lot,
+                    datetime.now().isoformat(timespec='seconds'),
+                    json.dumps([float(v) for v in optic_density]),
+                    json.dumps([float(v) for v in concentration])
+                )
+            )
+            self._conn.commit()
+    
+    def lots(self, hormone):
+        """Гормон учун сақланган лотлар (сана бўйича)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lot, recorded, optic_density, concentration FROM kit_lots WHERE hormone = ? ORDER BY recorded",
+                (hormone,)
+            ).fetchall()
+        return pd.DataFrame(
+            [(lot, recorded, json.loads(od), json.loads(conc)) for lot, recorded, od, conc in rows],
+            columns=['lot', 'recorded', 'optic_density', 'concentration']
+        )
+    
+    def target(self, hormone, series):
+        """Серия учун жорий мақсадли ўртача ва SD"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT n, mean, m2 FROM qc_state WHERE hormone = ? AND series = ?",
+                (hormone, series)
+            ).fetchone()
+        if not row or row[0] < 2:
+            return None, None
+        n, mean, m2 = row
+        return mean, np.sqrt(m2 / (n - 1))
+
+@st.cache_resource
+def get_qc_store():
+    """Барча сессиялар учун умумий QC омбори"""
+    return QCStore(QC_DB_PATH)
+
+def record_qc_run(calib, control_ods=None):
+    """Калибровкани QC омборига ёзиш; назорат OD лари концентрацияга ўгирилади"""
+    calibrator = get_panel_calibrator(calibration_key({calib['hormone']: calib}))
+    calib_data = calibrator.calibration_data[calib['hormone']]
+    
+    controls = {}
+    if control_ods:
+        names = list(control_ods.keys())
+        predictions, _ = calibrator.predict(calib['hormone'], list(control_ods.values()))
+        controls = dict(zip(names, predictions.tolist()))
+    
+    return get_qc_store().record_run(
+        calib['hormone'],
+        calib_data['regression'],
+        controls,
+        method=calib_data['method']
+    )
+
+# ==================== АУДИТ ЖУРНАЛИ ====================
+AUDIT_LOG_PATH = os.environ.get('BIOLAB_AUDIT_LOG', 'biolab_audit.jsonl')
+AUDIT_BATCH_SIZE = 500
+AUDIT_GENESIS_HASH = '0' * 64
+
+def _audit_hash(prev_hash, record):
+    """Ёзув ва олдинги хешдан занжир хешини ҳисоблаш"""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256((prev_hash + payload).encode('utf-8')).hexdigest()
+
+class AuditLog:
+    """Хеш-занжирли, фақат қўшиладиган аудит журнали (фон ёзувчи оқим билан)"""
+    
+    def __init__(self, path=AUDIT_LOG_PATH):
+        self.path = path
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._index = {'sample': {}, 'run': {}}
+        self._seq = 0
+        self._last_hash = AUDIT_GENESIS_HASH
+        self._size = 0
+        self.truncated_tail = 0
+        self._load_index()
+        
+        self._writer = threading.Thread(target=self._write_loop, name='audit-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+    
+    def _index_record(self, record, offset):
+        """Ёзувни намуна ID ва иш (run) бўйича индексга қўшиш"""
+        for sample_id in record.get('sample_ids') or ():
+            self._index['sample'].setdefault(str(sample_id), []).append(offset)
+        if record.get('run_id'):
+            self._index['run'].setdefault(str(record['run_id']), []).append(offset)
+    
+    def _load_index(self):
+        """Мавжуд журнални бир марта ўқиб, индекс ва занжир охирини тиклаш"""
+        if not os.path.exists(self.path):
+            return
+        
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if line.endswith(b'\n'):
+                        # Бузилган тўлиқ қатор индексланмайди; verify() уни кўрсатади
+                        offset += len(line)
+                        continue
+                    # Қулаш пайтида чала ёзилган охирги қатор (fsync тугамаган ёзув)
+                    self.truncated_tail = len(line)
+                    break
+                self._index_record(record, offset)
+                self._seq = record['seq']
+                self._last_hash = record['hash']
+                offset += len(line)
+        self._size = offset
+        
+        # Кейинги ёзувлар чала қаторга қўшилиб кетмаслиги учун у кесилади
+        if self.truncated_tail:
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+    
+    def log(self, event, sample_ids=None, **details):
+        """Ҳодисани навбатга қўйиш (блокламайди)"""
+        ctx = get_script_run_ctx()
+        self._queue.put_nowait({
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'event': event,
+            'session': ctx.session_id if ctx else None,
+            'run_id': details.pop('run_id', None),
+            'sample_ids': [str(v) for v in sample_ids] if sample_ids is not None else None,
+            'details': details
+        })
+    
+    def _write_loop(self):
+        """Навбатдаги ҳодисаларни тўплаб, битта ёзувда дискка чиқариш"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < AUDIT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            events = [event for event in batch if event is not None]
+            if events:
+                self._write_batch(events)
+            for _ in batch:
+                self._queue.task_done()
+            if len(events) < len(batch):
+                return
+    
+    def _write_batch(self, events):
+        lines = []
+        with self._lock:
+            for event in events:
+                self._seq += 1
+                record = {'seq': self._seq, **event, 'prev_hash': self._last_hash}
+                record['hash'] = self._last_hash = _audit_hash(self._last_hash, record)
+                line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+                self._index_record(record, self._size)
+                self._size += len(line)
+                lines.append(line)
+            
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def flush(self):
+        """Навбатдаги барча ҳодисалар ёзилишини кутиш"""
+        self._queue.join()
+    
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+    
+    def history(self, sample_id=None, run_id=None):
+        """Намуна ёки иш тарихини индекс орқали олиш (фақат дискка ёзилган ёзувлар, кутмайди)"""
+        with self._lock:
+            offsets = set()
+            if sample_id:
+                offsets.update(self._index['sample'].get(str(sample_id), ()))
+            if run_id:
+                offsets.update(self._index['run'].get(str(run_id), ()))
+        
+        records = []
+        if offsets:
+            with open(self.path, 'rb') as f:
+                for offset in sorted(offsets):
+                    f.seek(offset)
+                    records.append(json.loads(f.readline()))
+        
+        return pd.DataFrame(records, columns=['seq', 'time', 'event', 'session', 'run_id', 'details', 'hash'])
+    
+    def verify(self):
+        """Дискка ёзилган хеш занжирини текшириш; биринчи бузилган ёзув рақами ёки None"""
+        with self._lock:
+            size = self._size
+        prev_hash = AUDIT_GENESIS_HASH
+        seq = 0
+        
+        if not size:
+            return None
+        with open(self.path, 'rb') as f:
+            while f.tell() < size:
+                line = f.readline()
+                seq += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return seq
+                stored_hash = record.pop('hash')
+                if record['prev_hash'] != prev_hash or _audit_hash(prev_hash, record) != stored_hash:
+                    return record['seq']
+                prev_hash = stored_hash
+        return None
+
+@st.cache_resource
+def get_audit_log():
+    """Барча сессиялар учун умумий аудит журнали"""
+    return AuditLog(AUDIT_LOG_PATH)
+
+# ==================== РЕФЕРЕНТ ИНТЕРВАЛЛАР ====================
+SEXES = ('-', 'Эркак', 'Аёл')  # '-' - кўрсатилмаган
+CYCLE_PHASES = ('-', 'Фолликуляр', 'Овуляция', 'Лютеин', 'Менопауза')
+AGE_LIMIT = 150
+STATUS_LABELS = np.array(['Пастки', 'Нормал', 'Юкори'])
+# Калибровка диапазони (OD бўйича): ташқаридаги қийматлар экстраполяция қилинган
+RANGE_LABELS = np.array(['OD < стандартлар', 'Ичида', 'OD > стандартлар'])
+
+# гормон, бирлик, жинс ('*' - ҳар қандай), ёш [дан, гача), фаза ('*' - ҳар қандай), пастки, юқори
+REFERENCE_INTERVALS = [
+    ('Кортизол', 'нг/мл', '*', 0, 18, '*', 30.0, 210.0),
+    ('Кортизол', 'нг/мл', '*', 18, AGE_LIMIT, '*', 50.0, 230.0),
+    ('ТТГ', 'мкМЕ/мл', '*', 0, 18, '*', 0.7, 6.0),
+    ('ТТГ', 'мкМЕ/мл', '*', 18, AGE_LIMIT, '*', 0.4, 4.0),
+    ('Тестостерон', 'нг/мл', 'Эркак', 0, 18, '*', 0.1, 8.0),
+    ('Тестостерон', 'нг/мл', 'Эркак', 18, 50, '*', 2.5, 8.4),
+    ('Тестостерон', 'нг/мл', 'Эркак', 50, AGE_LIMIT, '*', 1.9, 7.4),
+    ('Тестостерон', 'нг/мл', 'Аёл', 18, AGE_LIMIT, '*', 0.1, 0.5),
+    ('Эстрадиол', 'пг/мл', 'Эркак', 18, AGE_LIMIT, '*', 25.8, 60.7),
+    ('Эстрадиол', 'пг/мл', 'Аёл', 18, AGE_LIMIT, 'Фолликуляр', 12.5, 166.0),
+    ('Эстрадиол', 'пг/мл', 'Аёл', 18, AGE_LIMIT, 'Овуляция', 85.8, 498.0),
+    ('Эстрадиол', 'пг/мл', 'Аёл', 18, AGE_LIMIT, 'Лютеин', 43.8, 211.0),
+    ('Эстрадиол', 'пг/мл', 'Аёл', 18, AGE_LIMIT, 'Менопауза', 5.0, 54.7),
+]
+# Лотинча ёзилган бирликлар кириллча шаклга келтирилади (калитлар normalize_unit дан кейин)
+UNIT_ALIASES = {
+    'ng/ml': 'нг/мл',
+    'pg/ml': 'пг/мл',
+    'µiu/ml': 'мкме/мл',
+    'uiu/ml': 'мкме/мл',
+    'miu/l': 'мкме/мл',
+    'мме/л': 'мкме/мл'
+}
+
+def normalize_unit(unit):
+    """Бирликни солиштириш учун ягона шаклга келтириш"""
+    unit = str(unit).strip().lower().replace(' ', '')
+    return UNIT_ALIASES.get(unit, unit)
+
+class ReferenceIntervalIndex:
+    """Гормон, жинс, ёш гуруҳи ва цикл фазаси бўйича индексланган референт интерваллар"""
+    
+    def __init__(self, intervals=REFERENCE_INTERVALS):
+        table = pd.DataFrame(
+            intervals,
+            columns=['hormone', 'unit', 'sex', 'age_from', 'age_to', 'phase', 'low', 'high']
+        )
+        # '*' қаторларни барча категорияларга ёйиш, шунда ҳар бир калит аниқ бўлади
+        table['sex'] = table['sex'].map(lambda v: list(SEXES) if v == '*' else [v])
+        table['phase'] = table['phase'].map(lambda v: list(CYCLE_PHASES) if v == '*' else [v])
+        table = table.explode('sex').explode('phase')
+        
+        self.hormones = tuple(dict.fromkeys(table['hormone']))
+        keys = self._encode(table['hormone'], table['sex'], table['phase'])
+        
+        order = np.lexsort((table['age_from'].to_numpy(), keys))
+        self._keys = keys[order]
+        self._starts = self._keys * AGE_LIMIT + table['age_from'].to_numpy(dtype=float)[order]
+        self._age_to = table['age_to'].to_numpy(dtype=float)[order]
+        self._low = table['low'].to_numpy(dtype=float)[order]
+        self._high = table['high'].to_numpy(dtype=float)[order]
+        self._unit = table['unit'].map(normalize_unit).to_numpy(dtype=object)[order]
+    
+    def _encode(self, hormone, sex, phase):
+        """(гормон, жинс, фаза) ни битта бутун сон калитга ўгириш; номаълум -> -1"""
+        h = pd.Categorical(hormone, categories=self.hormones).codes.astype(np.int64)
+        x = pd.Categorical(sex, categories=SEXES).codes.astype(np.int64)
+        p = pd.Categorical(phase, categories=CYCLE_PHASES).codes.astype(np.int64)
+        keys = (h * len(SEXES) + x) * len(CYCLE_PHASES) + p
+        keys[(h < 0) | (x < 0) | (p < 0)] = -1
+        return keys
+    
+    def lookup(self, hormone, sex, age, phase, unit=None):
+        """Ҳар бир натижа учун (пастки, юқори) чегаралар; топилмаса ёки бирлик мос келмаса NaN"""
+        age = np.asarray(age, dtype=float)
+        hormone, sex, phase, unit = (
+            np.broadcast_to(np.asarray(v, dtype=object), age.shape).ravel()
+            for v in (hormone, sex, phase, unit)
+        )
+        age = age.ravel()
+        keys = self._encode(hormone, sex, phase)
+        
+        idx = np.searchsorted(self._starts, keys * AGE_LIMIT + age, side='right') - 1
+        idx_safe = np.clip(idx, 0, len(self._starts) - 1)
+        found = (
+            (idx >= 0) & (keys >= 0) & ~np.isnan(age)
+            & (self._keys[idx_safe] == keys) & (age < self._age_to[idx_safe])
+        )
+        if unit[0] is not None:
+            # Интерваллар фақат ўз бирлигидаги концентрацияларга қўлланади
+            found &= pd.Series(unit).map(normalize_unit).to_numpy(dtype=object) == self._unit[idx_safe]
+        
+        low = np.where(found, self._low[idx_safe], np.nan)
+        high = np.where(found, self._high[idx_safe], np.nan)
+        return low, high
+    
+    def classify(self, hormone, concentration, sex, age, phase, unit=None):
+        """Концентрацияни -1/0/1 га ажратиш; интервал топилмаса NaN"""
+        concentration = np.asarray(concentration, dtype=float)
+        low, high = self.lookup(hormone, sex, np.broadcast_to(age, concentration.shape), phase, unit)
+        values = concentration.ravel()
+        status = np.where(values < low, -1.0, np.where(values > high, 1.0, 0.0))
+        status[np.isnan(low) | np.isnan(values)] = np.nan
+        return status.reshape(concentration.shape)
+
+@st.cache_resource
+def get_reference_index():
+    """Референт интерваллар индексини бир марта қуриш"""
+    return ReferenceIntervalIndex()
+
+def patient_status(hormone, predictions, range_status, patients, unit):
+    """Беморлар ҳолати: референт интервал бўйича, топилмаса калибровка диапазони бўйича"""
+    demographics = pd.DataFrame(patients).reindex(columns=['Жинс', 'Ёш', 'Фаза'])
+    # Беморлар × гормонлар матрицаси учун демография устун вектор бўлади
+    column = (-1,) + (1,) * (np.ndim(predictions) - 1)
+    ref_status = get_reference_index().classify(
+        hormone,
+        predictions,
+        demographics['Жинс'].fillna('-').to_numpy(dtype=object).reshape(column),
+        pd.to_numeric(demographics['Ёш'], errors='coerce').to_numpy().reshape(column),
+        demographics['Фаза'].fillna('-').to_numpy(dtype=object).reshape(column),
+        unit
+    )
+    return np.where(np.isnan(ref_status), range_status, ref_status).astype(int)
+
+# ==================== ПАНЕЛ КАЛИБРОВКА ====================
+def make_calibration(hormone, unit, optic_density, concentration, method='linear'):
+    """Сессия учун калибровка ёзувини яратиш"""
+    optic_density = [float(v) for v in optic_density]
+    concentration = [float(v) for v in concentration]
+    return {
+        'hormone': hormone,
+        'unit': unit,
+        'method': method,
+        'optic_density': optic_density,
+        'concentration': concentration,
+        'standards_df': pd.DataFrame({
+            '№': np.arange(1, len(optic_density) + 1),
+            'Оптик зичлик': optic_density,
+            f'Концентрация ({unit})': concentration
+        })
+    }
+
+def get_calibrations():
+    """Сессиядаги барча фаол калибровкалар (гормон -> калибровка)"""
+    calibrations = st.session_state.setdefault('calibrations', {})
+    if not calibrations and 'calibration' in st.session_state:
+        calib = st.session_state['calibration']
+        calibrations[calib['hormone']] = calib
+    return calibrations
+
+def start_run():
+    """Фойдаланувчи амали (панел, импорт, тиклаш) учун битта янги иш ID си"""
+    st.session_state['run_id'] = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    return st.session_state['run_id']
+
+def set_calibration(calib, audit=True):
+    """Калибровкани панелга қўшиш ва уни фаол қилиш; иш ID сини чақирувчи очади"""
+    get_calibrations()[calib['hormone']] = calib
+    st.session_state['calibration'] = calib
+    if not audit:
+        return
+    
+    get_audit_log().log(
+        'standards',
+        run_id=st.session_state['run_id'],
+        hormone=calib['hormone'],
+        unit=calib['unit'],
+        method=calib.get('method', 'linear'),
+        optic_density=calib['optic_density'],
+        concentration=calib['concentration']
+    )
+    # Умумий кэшдаги калибратор ҳар бир сессия учун қайта ишламайди, шунинг учун ҳодиса шу ерда ёзилади
+    get_audit_log().log(
+        'calibrate',
+        run_id=st.session_state['run_id'],
+        hormone=calib['hormone'],
+        method=calib.get('method', 'linear'),
+        r_squared=calculate_regression(calib['optic_density'], calib['concentration'])['r_squared']
+    )
+
+def select_calibration(key):
+    """Панелда бир нечта гормон бўлса, кўрсатиладиганини танлаш"""
+    calibrations = get_calibrations()
+    hormones = list(calibrations)
+    if len(hormones) == 1:
+        return calibrations[hormones[0]]
+    
+    active = st.session_state.get('calibration', {}).get('hormone')
+    hormone = st.selectbox(
+        "Гормон",
+        hormones,
+        index=hormones.index(active) if active in hormones else 0,
+        key=key
+    )
+    return calibrations[hormone]
+
+def calibration_key(calibrations):
+    """Калибровкалардан кэш учун ўзгармас калит"""
+    return tuple(
+        (
+            hormone,
+            calib['unit'],
+            calib.get('method', 'linear'),
+            tuple(calib['optic_density']),
+            tuple(calib['concentration'])
+        )
+        for hormone, calib in calibrations.items()
+    )
+
+@st.cache_resource(max_entries=32)
+def get_panel_calibrator(key):
+    """Панелдаги барча гормонлар учун калибровка қилинган умумий калибратор"""
+    calibrator = HormoneCalibrator()
+    methods = {}
+    for hormone, unit, method, optic_density, concentration in key:
+        calibrator.add_standard(hormone, list(optic_density), list(concentration), unit)
+        methods[hormone] = method
+    calibrator.calibrate_all(methods)
+    return calibrator
+
+def patient_od_matrix(patients, hormones):
+    """Беморлар × гормонлар OD матрицаси; умумий OD фақат бир гормонли панелда ишлатилади"""
+    df = pd.DataFrame(patients)
+    # Умумий устун қайси гормон учун ўлчангани номаълум: панелда бир нечта гормон бўлса NaN
+    generic = pd.Series(np.nan, index=df.index)
+    if len(hormones) == 1 and 'Оптик зичлик' in df:
+        generic = pd.to_numeric(df['Оптик зичлик'], errors='coerce')
+    columns = [
+        pd.to_numeric(df[f'Оптик зичлик ({hormone})'], errors='coerce')
+        if f'Оптик зичлик ({hormone})' in df else generic
+        for hormone in hormones
+    ]
+    return np.column_stack([c.to_numpy(dtype=float) for c in columns]) if columns else np.empty((len(df), 0))
+
+def evaluate_panel(calibrations, patients):
+    """Барча гормонлар бўйича беморларни битта ўтишда ҳисоблаш; ҳолат ва калибровка диапазони алоҳида"""
+    hormones = list(calibrations)
+    calibrator = get_panel_calibrator(calibration_key(calibrations))
+    od = patient_od_matrix(patients, hormones)
+    predictions, range_status = calibrator.predict_all(hormones, od)
+    status = patient_status(
+        np.array(hormones, dtype=object),
+        predictions,
+        range_status,
+        patients,
+        np.array([calibrations[hormone]['unit'] for hormone in hormones], dtype=object)
+    )
+    return hormones, od, predictions, status, range_status
+
+def panel_results(calibrations, patients, uncertainty=None):
+    """Панел натижаларини узун форматдаги жадвалга йиғиш"""
+    hormones, od, predictions, status, range_status = evaluate_panel(calibrations, patients)
+    df_patients = pd.DataFrame(patients).reindex(columns=['ID', 'Изоҳ'])
+    n_patients, n_hormones = od.shape
+    
+    results = pd.DataFrame({
+        'ID': np.repeat(df_patients['ID'].to_numpy(), n_hormones),
+        'Гормон': np.tile(hormones, n_patients),
+        'Оптик зичлик': od.ravel(),
+        'Концентрация': predictions.ravel(),
+        'Бирлик': np.tile([calibrations[h]['unit'] for h in hormones], n_patients),
+        'Ҳолат': STATUS_LABELS[status.ravel() + 1],
+        # Референт ҳолат экстраполяцияни яширмаслиги учун диапазон белгиси алоҳида устунда
+        'Диапазон': RANGE_LABELS[range_status.ravel() + 1],
+        'Изоҳ': np.repeat(df_patients['Изоҳ'].fillna('').to_numpy(), n_hormones)
+    })
+    
+    if uncertainty is not None:
+        results.insert(4, 'Конц. 2.5%', uncertainty['low'].ravel())
+        results.insert(5, 'Конц. 97.5%', uncertainty['high'].ravel())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results.insert(6, 'CV %', 100 * uncertainty['sd'].ravel() / np.abs(predictions.ravel()))
+    
+    return results[~np.isnan(od.ravel())].reset_index(drop=True)
+
+# ==================== ЎЛЧОВ НОАНИҚЛИГИ ====================
+UNCERTAINTY_DEFAULTS = {
+    'od_sd': 0.005,        # ридер шовқини (OD бирлигида)
+    'pipetting_cv': 0.03,  # пипетлаш вариацияси (нисбий)
+    'n_draws': 1000,
+    'seed': 42
+}
+UNCERTAINTY_CHUNK = 1_000_000  # бир блокдаги элементлар сони (беморлар × симуляциялар)
+
+def monte_carlo_uncertainty(f, optic_density_values, od_sd=0.005, pipetting_cv=0.03,
+                            n_draws=1000, seed=42, chunk_elements=UNCERTAINTY_CHUNK):
+    """Ғалаёнланган OD матрицаларини эгри чизиқ орқали блокларда ўтказиш"""
+    od = np.asarray(optic_density_values, dtype=float).ravel()
+    rng = np.random.default_rng(seed)
+    rows = max(1, chunk_elements // n_draws)
+    
+    result = {name: np.full(od.shape, np.nan) for name in ('mean', 'sd', 'low', 'high')}
+    for start in range(0, len(od), rows):
+        block = od[start:start + rows, None]
+        shape = (len(block), n_draws)
+        perturbed = block * (1 + pipetting_cv * rng.standard_normal(shape)) + od_sd * rng.standard_normal(shape)
+        conc = np.asarray(f(perturbed.ravel())).reshape(shape)
+        
+        stop = start + len(block)
+        result['mean'][start:stop] = conc.mean(axis=1)
+        result['sd'][start:stop] = conc.std(axis=1, ddof=1)
+        result['low'][start:stop], result['high'][start:stop] = np.percentile(conc, [2.5, 97.5], axis=1)
+    
+    return result
+
+def panel_uncertainty(calibrations, patients, **settings):
+    """Бутун панел учун беморлар × гормонлар ноаниқлик матрицалари"""
+    settings = {**UNCERTAINTY_DEFAULTS, **settings}
+    hormones = list(calibrations)
+    calibrator = get_panel_calibrator(calibration_key(calibrations))
+    od = patient_od_matrix(patients, hormones)
+    
+    result = {name: np.full(od.shape, np.nan) for name in ('sd', 'low', 'high')}
+    for j, hormone in enumerate(hormones):
+        measured = ~np.isnan(od[:, j])
+        if not measured.any():
+            continue
+        # Уруғ гормон номининг барқарор хешидан: натижа панел таркиби ва тартибига боғлиқ эмас
+        hormone_seed = int.from_bytes(hashlib.sha256(hormone.encode('utf-8')).digest()[:8], 'little')
+        column = calibrator.predict_uncertainty(
+            hormone,
+            od[measured, j],
+            **{**settings, 'seed': (settings['seed'], hormone_seed)}
+        )
+        for name in result:
+            result[name][measured, j] = column[name]
+    
+    return result
+
+# ==================== СЕССИЯ СНАПШОТИ ====================
+SNAPSHOT_FORMAT = 'biolab-snapshot'
+SNAPSHOT_VERSION = 1
+
+def _frame_to_arrays(section, df):
+    """DataFrame ни устунли массивларга ажратиш (pickle сиз); матн устунлари учун бўш қийматлар ниқоби"""
+    arrays = {}
+    for i, (name, column) in enumerate(df.items()):
+        if column.dtype.kind in 'biuf':
+            arrays[f'{section}.{i}'] = column.to_numpy()
+        else:
+            arrays[f'{section}.{i}'] = column.fillna('').astype(str).to_numpy(dtype=str)
+            if column.isna().any():
+                arrays[f'{section}.{i}.null'] = column.isna().to_numpy()
+    return arrays, [str(name) for name in df.columns]
+
+def panel_state_key(calibrations, patients):
+    """Калибровкалар ва беморлар ҳолатининг қисқа хеши"""
+    digest = hashlib.sha1(repr(calibration_key(calibrations)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(pd.DataFrame(patients), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def build_session_snapshot(calibrations, patients):
+    """Сессияни версияланган ихчам бинар снапшотга ёзиш (сиқилган npz)"""
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'sections': {}
+    }
+    arrays = {}
+    
+    if calibrations:
+        calibrator = get_panel_calibrator(calibration_key(calibrations))
+        entries = []
+        for i, (hormone, calib) in enumerate(calibrations.items()):
+            arrays[f'calibrations.{i}.od'] = np.asarray(calib['optic_density'], dtype=float)
+            arrays[f'calibrations.{i}.conc'] = np.asarray(calib['concentration'], dtype=float)
+            regression = calibrator.calibration_data[hormone]['regression']
+            entries.append({
+                'hormone': hormone,
+                'unit': calib['unit'],
+                'method': calib.get('method', 'linear'),
+                'regression': {name: float(value) for name, value in regression.items()}
+            })
+        meta['sections']['calibrations'] = entries
+    
+    if patients:
+        patient_arrays, columns = _frame_to_arrays('patients', pd.DataFrame(patients))
+        arrays.update(patient_arrays)
+        meta['sections']['patients'] = {'columns': columns}
+        
+        if calibrations:
+            result_arrays, columns = _frame_to_arrays('results', panel_results(calibrations, patients))
+            arrays.update(result_arrays)
+            meta['sections']['results'] = {
+                'columns': columns,
+                'state_key': panel_state_key(calibrations, patients)
+            }
+    
+    arrays['meta'] = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+class SessionSnapshot:
+    """Бинар сессия снапшоти; ҳар бир бўлим массивлари сўралганда ўқилади"""
+    
+    def __init__(self, data):
+        self._npz = np.load(io.BytesIO(data), allow_pickle=False)
+        if 'meta' not in self._npz.files:
+            raise ValueError("Снапшот формати нотўғри")
+        
+        self.meta = json.loads(self._npz['meta'].tobytes().decode('utf-8'))
+        if self.meta.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError("Снапшот формати нотўғри")
+        if self.meta.get('version', 0) > SNAPSHOT_VERSION:
+            raise ValueError(f"Снапшот версияси ({self.meta['version']}) қўллаб-қувватланмайди")
+    
+    @property
+    def sections(self):
+        return list(self.meta['sections'])
+    
+    def _frame(self, section):
+        columns = self.meta['sections'][section]['columns']
+        frame = pd.DataFrame({name: self._npz[f'{section}.{i}'] for i, name in enumerate(columns)})
+        for i, name in enumerate(columns):
+            if f'{section}.{i}.null' in self._npz.files:
+                frame[name] = frame[name].astype(object).mask(self._npz[f'{section}.{i}.null'], np.nan)
+        return frame
+    
+    def calibrations(self):
+        return {
+            entry['hormone']: make_calibration(
+                entry['hormone'],
+                entry['unit'],
+                self._npz[f'calibrations.{i}.od'],
+                self._npz[f'calibrations.{i}.conc'],
+                method=entry['method']
+            )
+            for i, entry in enumerate(self.meta['sections']['calibrations'])
+        }
+    
+    def patients(self):
+        return self._frame('patients').to_dict('records')
+    
+    def results(self):
+        return self.meta['sections']['results']['state_key'], self._frame('results')
+
+def load_session_snapshot(data):
+    """Снапшотдан калибровка ва беморларни тиклаш; натижалар экспортда керак бўлганда ўқилади"""
+    snapshot = SessionSnapshot(data)
+    st.session_state.pop('snapshot', None)
+    st.session_state.pop('snapshot_results', None)
+    
+    # Барча таблар ҳар бир rerun да ишлайди, шунинг учун калибровка ва беморлар дарҳол керак
+    hormones, sample_ids = [], None
+    if 'calibrations' in snapshot.sections:
+        st.session_state['calibrations'] = {}
+        for calib in snapshot.calibrations().values():
+            # Тикланган калибровка янги стандарт ёки калибровка эмас
+            set_calibration(calib, audit=False)
+            hormones.append(calib['hormone'])
+    if 'patients' in snapshot.sections:
+        st.session_state['patients'] = snapshot.patients()
+        st.session_state['patients_imported'] = True
+        sample_ids = [p['ID'] for p in st.session_state['patients']]
+    get_audit_log().log(
+        'restore',
+        sample_ids=sample_ids,
+        run_id=start_run(),
+        hormones=hormones,
+        created=snapshot.meta['created']
+    )
+    if 'results' in snapshot.sections:
+        st.session_state['snapshot'] = snapshot
+    return snapshot
+
+def restore_snapshot_results():
+    """Снапшотдаги натижаларни фақат экспорт уларни сўраганда ўқиш"""
+    snapshot = st.session_state.pop('snapshot', None)
+    if snapshot is not None:
+        st.session_state['snapshot_results'] = snapshot.results()
+
+# ==================== ЛОТЛАРНИ СОЛИШТИРИШ ====================
+LOT_EQUIVALENCE_MARGIN = 0.10  # қиялик ва кесишма учун нисбий эквивалентлик чегараси
+LOT_BIAS_LIMIT = 10.0          # ўлчов диапазонида рухсат этилган максимал силжиш (%)
+LOT_GRID_POINTS = 200
+
+def _padded_curves(lots):
+    """Турли узунликдаги стандартларни OD бўйича сараланган NaN-тўлдирилган матрицага йиғиш"""
+    width = max(len(od) for od in lots['optic_density'])
+    x = np.full((len(lots), width), np.nan)
+    y = np.full((len(lots), width), np.nan)
+    for i, (od, conc) in enumerate(zip(lots['optic_density'], lots['concentration'])):
+        order = np.argsort(od)
+        x[i, :len(od)] = np.asarray(od, dtype=float)[order]
+        y[i, :len(od)] = np.asarray(conc, dtype=float)[order]
+    return x, y
+
+def interpolate_curves(x, y, grid):
+    """Ҳар бир қатор эгри чизиғини умумий OD тўрида чизиқли интерполяция (векторли)"""
+    x_sorted = np.where(np.isnan(x), np.inf, x)
+    n_points = (~np.isnan(x)).sum(axis=1)
+    
+    # Ҳар бир лот ва тўр нуқтаси учун чап стандарт индекси
+    left = (x_sorted[:, :, None] <= grid[None, None, :]).sum(axis=1) - 1
+    left = np.clip(left, 0, np.maximum(n_points - 2, 0)[:, None])
+    right = left + 1
+    
+    x0, x1 = np.take_along_axis(x_sorted, left, axis=1), np.take_along_axis(x_sorted, right, axis=1)
+    y0, y1 = np.take_along_axis(y, left, axis=1), np.take_along_axis(y, right, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return y0 + (y1 - y0) * (grid[None, :] - x0) / (x1 - x0)
+
+def _tost_p_value(diff, se, margin, dof):
+    """Икки томонлама эквивалентлик тести (TOST) p-қиймати"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_lower = stats.t.sf((diff + margin) / se, dof)
+        p_upper = stats.t.cdf((diff - margin) / se, dof)
+    return np.maximum(p_lower, p_upper)
+
+def compare_lots(lots, reference_lot, weighting='none', grid_points=LOT_GRID_POINTS):
+    """N та лот эгри чизиғини референт лотга нисбатан солиштириш"""
+    x, y = _padded_curves(lots)
+    fit = weighted_regression_batch(x, y, weighting)
+    ref = int(np.flatnonzero(lots['lot'].to_numpy() == reference_lot)[0])
+    
+    # Қиялик ва кесишма фарқи учун TOST (Welch-Satterthwaite ўрнига оддий n1 + n2 - 4)
+    dof = fit['n'] + fit['n'][ref] - 4
+    slope_diff = fit['slope'] - fit['slope'][ref]
+    slope_se = np.sqrt(fit['std_err']**2 + fit['std_err'][ref]**2)
+    intercept_diff = fit['intercept'] - fit['intercept'][ref]
+    intercept_se = np.sqrt(fit['intercept_err']**2 + fit['intercept_err'][ref]**2)
+    intercept_margin = LOT_EQUIVALENCE_MARGIN * np.nanmean(np.abs(y[ref]))
+    
+    slope_p = _tost_p_value(slope_diff, slope_se, LOT_EQUIVALENCE_MARGIN * abs(fit['slope'][ref]), dof)
+    intercept_p = _tost_p_value(intercept_diff, intercept_se, intercept_margin, dof)
+    
+    # Барча лотлар учун умумий ўлчов диапазони (OD лар кесишмаси)
+    grid = np.linspace(np.nanmax(np.nanmin(x, axis=1)), np.nanmin(np.nanmax(x, axis=1)), grid_points)
+    curves = interpolate_curves(x, y, grid)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bias = 100 * (curves - curves[ref]) / np.abs(curves[ref])
+    
+    # Нол стандарт атрофида нисбий силжиш маъносиз: энг кичик мусбат стандартдан паст нуқталар олинмайди
+    lower_limit = np.nanmin(np.where(y[ref] > 0, y[ref], np.nan))
+    bias[:, ~(np.isfinite(bias).all(axis=0) & (curves[ref] >= lower_limit))] = np.nan
+    
+    summary = pd.DataFrame({
+        'Лот': lots['lot'].to_numpy(),
+        'Сана': lots['recorded'].to_numpy(),
+        'Қиялик': fit['slope'],
+        'Кесишма': fit['intercept'],
+        'R²': fit['r_squared'],
+        'Қиялик p (TOST)': slope_p,
+        'Кесишма p (TOST)': intercept_p,
+        'Ўртача силжиш %': np.nanmean(bias, axis=1),
+        'Макс. |силжиш| %': np.nanmax(np.abs(bias), axis=1)
+    })
+    summary['Эквивалент'] = (
+        (slope_p < 0.05) & (intercept_p < 0.05) & (summary['Макс. |силжиш| %'] <= LOT_BIAS_LIMIT)
+    )
+    summary.loc[ref, ['Қиялик p (TOST)', 'Кесишма p (TOST)']] = np.nan
+    summary.loc[ref, 'Эквивалент'] = True
+    
+    return summary, grid, bias
+
+# ==================== ҚАЙТА ЎЛЧАШ РЎЙХАТИ ====================
+DILUTION_STEPS = np.array([2, 5, 10, 20, 50, 100, 200, 500, 1000])
+PLATE_WELLS = (8, 12)
+WORKLIST_REPLICATES = 2
+
+def plan_dilutions(calibrations, patients):
+    """Диапазондан ташқари намуналар ва эгри чизиқ бўйича тавсия этилган суюлтириш"""
+    hormones = list(calibrations)
+    calibrator = get_panel_calibrator(calibration_key(calibrations))
+    od = patient_od_matrix(patients, hormones)
+    predictions, status = calibrator.predict_all(hormones, od)
+    
+    slopes = np.array([calibrator.calibration_data[h]['regression']['slope'] for h in hormones])
+    low_conc = np.array([min(calibrations[h]['concentration']) for h in hormones])
+    high_conc = np.array([max(calibrations[h]['concentration']) for h in hormones])
+    
+    # Ўсувчи эгри чизиқда юқори OD, тушувчида (рақобатли ИФА) паст OD юқори концентрация
+    above = (status != 0) & (status == np.sign(slopes))
+    target = (low_conc + high_conc) / 2
+    needed = predictions / target
+    steps = np.clip(np.searchsorted(DILUTION_STEPS, needed), 0, len(DILUTION_STEPS) - 1)
+    factors = np.where(above, DILUTION_STEPS[steps], 1)
+    
+    rows, cols = np.nonzero(status != 0)
+    ids = pd.DataFrame(patients)['ID'].astype(str).to_numpy()
+    return pd.DataFrame({
+        'ID': ids[rows],
+        'Гормон': np.array(hormones, dtype=object)[cols],
+        'Оптик зичлик': od[rows, cols],
+        'Тахминий концентрация': predictions[rows, cols],
+        'Суюлтириш': factors[rows, cols],
+        'Сабаб': np.where(above[rows, cols], 'Юқори', 'Паст')
+    })
+
+def plate_layout(hormone, n_standards, replicates, plate_shape=PLATE_WELLS):
+    """Лунка тартиби, стандартлар эгаллаган лункалар ва планшетдаги намуналар сиғими"""
+    n_rows, n_cols = plate_shape
+    # Лунклар устун бўйича тўлдирилади (A1, B1, ... H1, A2, ...)
+    wells = _plate_wells(n_rows, n_cols).reshape(n_rows, n_cols).T.ravel()
+    reserved = n_standards * replicates
+    capacity = (len(wells) - reserved) // replicates
+    if capacity <= 0:
+        raise ValueError(f"{hormone or 'Гормон'}: планшетда намуналар учун жой қолмади")
+    return wells, reserved, capacity
+
+def pack_worklist(plan, calibrations, replicates=WORKLIST_REPLICATES, plate_shape=PLATE_WELLS):
+    """Суюлтириш гуруҳларини планшетларга first-fit decreasing усулида жойлаш"""
+    plates = []
+    
+    for hormone, group in plan.groupby('Гормон', sort=False):
+        concentrations = sorted(calibrations[hormone]['concentration'])
+        wells, reserved, capacity = plate_layout(hormone, len(concentrations), replicates, plate_shape)
+        
+        # Бир хил суюлтиришдаги намуналар бирга қолади; сиғимдан каттаси бўлакланади
+        chunks = [
+            items.iloc[start:start + capacity]
+            for _, items in group.groupby('Суюлтириш')
+            for start in range(0, len(items), capacity)
+        ]
+        chunks.sort(key=len, reverse=True)
+        
+        bins = []
+        for chunk in chunks:
+            for plate in bins:
+                if plate['free'] >= len(chunk):
+                    plate['chunks'].append(chunk)
+                    plate['free'] -= len(chunk)
+                    break
+            else:
+                bins.append({'free': capacity - len(chunk), 'chunks': [chunk]})
+        
+        standards = pd.DataFrame({
+            'ID': [f"STD:{c:g}" for c in concentrations],
+            'Гормон': hormone,
+            'Суюлтириш': 1
+        })
+        for number, plate in enumerate(bins, start=1):
+            items = pd.concat([standards] + plate['chunks'], ignore_index=True)
+            items = items.loc[items.index.repeat(replicates)].reset_index(drop=True)
+            items.insert(0, 'Планшет', f"RR-{hormone}-{number}")
+            items.insert(1, 'Лунка', wells[:len(items)])
+            items['Такрор'] = np.tile(np.arange(1, replicates + 1), len(items) // replicates)
+            plates.append(items)
+    
+    if not plates:
+        return pd.DataFrame(columns=['Планшет', 'Лунка', 'ID', 'Гормон', 'Суюлтириш', 'Такрор'])
+    return pd.concat(plates, ignore_index=True)
+
+def merge_rerun_results(results, rerun, calibrations, patients):
+    """Қайта ўлчанган OD ларни суюлтиришга тузатиб натижаларга битта ўтишда қўшиш"""
+    rerun = rerun.assign(ID=rerun['ID'].astype(str))
+    rerun = rerun[~rerun['ID'].str.startswith('STD') & rerun['Қайта OD'].notna()]
+    measured = rerun.groupby(['ID', 'Гормон'], as_index=False).agg(
+        od=('Қайта OD', 'mean'),
+        factor=('Суюлтириш', 'first')
+    )
+    
+    hormones = list(calibrations)
+    measured = measured[measured['Гормон'].isin(hormones)].reset_index(drop=True)
+    rows = np.arange(len(measured))
+    cols = pd.Categorical(measured['Гормон'], categories=hormones).codes
+    
+    # Ҳар бир қайта ўлчаш ўз гормони устунига жойлашган сийрак OD матрицаси
+    od_matrix = np.full((len(measured), len(hormones)), np.nan)
+    od_matrix[rows, cols] = measured['od'].to_numpy(dtype=float)
+    calibrator = get_panel_calibrator(calibration_key(calibrations))
+    predictions, status = calibrator.predict_all(hormones, od_matrix)
+    measured['corrected'] = predictions[rows, cols] * measured['factor'].to_numpy(dtype=float)
+    measured['in_range'] = status[rows, cols] == 0
+    
+    merged = results.assign(ID=results['ID'].astype(str)).merge(
+        measured[['ID', 'Гормон', 'factor', 'corrected', 'in_range']],
+        on=['ID', 'Гормон'],
+        how='left'
+    )
+    update = merged['in_range'].fillna(False).astype(bool).to_numpy()
+    merged['Суюлтириш'] = np.where(update, merged['factor'], 1)
+    merged['Концентрация'] = np.where(update, merged['corrected'], merged['Концентрация'])
+    
+    # Тузатилган концентрациялар учун ҳолат референт интерваллар бўйича қайта баҳоланади
+    demographics = pd.DataFrame(patients).reindex(columns=['ID', 'Жинс', 'Ёш', 'Фаза'])
+    demographics = merged[['ID']].merge(
+        demographics.assign(ID=demographics['ID'].astype(str)).drop_duplicates('ID'),
+        on='ID',
+        how='left'
+    )
+    ref_status = get_reference_index().classify(
+        merged['Гормон'].to_numpy(dtype=object),
+        merged['Концентрация'].to_numpy(dtype=float),
+        demographics['Жинс'].fillna('-').to_numpy(dtype=object),
+        pd.to_numeric(demographics['Ёш'], errors='coerce').to_numpy(),
+        demographics['Фаза'].fillna('-').to_numpy(dtype=object),
+        merged['Бирлик'].to_numpy(dtype=object)
+    )
+    new_labels = STATUS_LABELS[np.nan_to_num(ref_status).astype(int) + 1]
+    merged['Ҳолат'] = np.where(update, new_labels, merged['Ҳолат'])
+    merged['Диапазон'] = np.where(update, RANGE_LABELS[1], merged['Диапазон'])
+    
+    return merged.drop(columns=['factor', 'corrected', 'in_range'])
+
+# ==================== EXCEL ИМПОРТ ====================
+PLATE_FORMATS = {12: 8, 24: 16}  # устунлар сони -> қаторлар сони (96 ва 384 лункали)
+LAYOUT_SHEET_NAMES = ('layout', 'лейаут', 'схема')
+ROLE_PREFIXES = {
+    'STD': 'Стандарт',
+    'BLK': 'Бланк',
+    'QC': 'Назорат',
+    'CTRL': 'Назорат'
+}
+
+def _iter_workbook_sheets(file_bytes, file_name):
+    """Excel варақларини оқимли ўқиш: (варақ номи, қаторлар итератори)"""
+    if file_name.lower().endswith('.xls'):
+        book = xlrd.open_workbook(file_contents=file_bytes, on_demand=True)
+        try:
+            for idx, sheet_name in enumerate(book.sheet_names()):
+                sheet = book.sheet_by_index(idx)
+                yield sheet_name, ([cell.value for cell in row] for row in sheet.get_rows())
+                book.unload_sheet(idx)
+        finally:
+            book.release_resources()
+    else:
+        book = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+        try:
+            for ws in book.worksheets:
+                ws.reset_dimensions()
+                yield ws.title, ws.iter_rows(values_only=True)
+        finally:
+            book.close()
+
+def _is_column_header(values):
+    """Қатор 1..N устун рақамларидан иборатлигини текшириш"""
+    try:
+        return [int(float(v)) for v in values] == list(range(1, len(values) + 1))
+    except (TypeError, ValueError):
+        return False
+
+def _read_plate_grid(rows):
+    """Варақдан 8×12 ёки 16×24 планшет тўрини топиш"""
+    rows = iter(rows)
+    for row in rows:
+        header = [v for v in row[1:] if v not in (None, '')]
+        if len(header) not in PLATE_FORMATS or not _is_column_header(header):
+            continue
+        
+        n_cols = len(header)
+        n_rows = PLATE_FORMATS[n_cols]
+        grid = np.full((n_rows, n_cols), None, dtype=object)
+        for i, grid_row in zip(range(n_rows), rows):
+            values = list(grid_row[1:n_cols + 1])
+            grid[i, :len(values)] = values
+        return grid
+    return None
+
+def _plate_wells(n_rows, n_cols):
+    """Лунка номлари (A1, A2, ... H12) ни қатор бўйича ясаш"""
+    row_labels = np.array(list(string.ascii_uppercase[:n_rows]))
+    col_labels = np.arange(1, n_cols + 1).astype(str)
+    return np.char.add(np.repeat(row_labels, n_cols), np.tile(col_labels, n_rows))
+
+def plates_to_long(plates, layout):
+    """Бир хил ўлчамли планшетларни узун форматга ўтказиш (векторли)"""
+    names = list(plates.keys())
+    od_stack = np.stack([plates[name] for name in names])
+    n_plates, n_rows, n_cols = od_stack.shape
+    
+    layout_ids = pd.Series(layout.ravel()).astype('string').str.strip()
+    
+    df = pd.DataFrame({
+        'Планшет': np.repeat(names, n_rows * n_cols),
+        'Лунка': np.tile(_plate_wells(n_rows, n_cols), n_plates),
+        'ID': np.tile(layout_ids.to_numpy(dtype=object), n_plates),
+        'Оптик зичлик': pd.to_numeric(pd.Series(od_stack.ravel()), errors='coerce').to_numpy()
+    })
+    return df
+
+@st.cache_data(show_spinner=False)
+def parse_plate_workbook(file_bytes, file_name):
+    """Планшет ва лейаут варақларидан узун форматли жадвал яратиш"""
+    layout = None
+    plates_by_shape = {}
+    
+    for sheet_name, rows in _iter_workbook_sheets(file_bytes, file_name):
+        grid = _read_plate_grid(rows)
+        if grid is None:
+            continue
+        if sheet_name.strip().lower() in LAYOUT_SHEET_NAMES:
+            layout = grid
+        else:
+            plates_by_shape.setdefault(grid.shape, {})[sheet_name] = grid
+    
+    if layout is None:
+        raise ValueError("Лейаут варағи топилмади (Layout / Лейаут / Схема)")
+    if layout.shape not in plates_by_shape:
+        raise ValueError("Лейаут ўлчамига мос планшет варақлари топилмади")
+    
+    df = plates_to_long(plates_by_shape[layout.shape], layout)
+    df = df[df['ID'].notna() & (df['ID'] != '')].reset_index(drop=True)
+    
+    # Роль ва стандарт концентрацияси ID префиксидан (масалан, "STD:12.5")
+    ids = df['ID'].astype(str).str.upper()
+    prefix = ids.str.extract(r'^(STD|BLK|QC|CTRL)', expand=False)
+    df['Роль'] = prefix.map(ROLE_PREFIXES).fillna('Намуна')
+    df['Концентрация'] = pd.to_numeric(
+        ids.str.extract(r'^STD\s*[:=]\s*([\d.,]+)', expand=False).str.replace(',', '.'),
+        errors='coerce'
+    )
+    
+    return df[['Планшет', 'Лунка', 'ID', 'Роль', 'Оптик зичлик', 'Концентрация']]
+
+def route_plate_import(df, hormone_name, unit):
+    """Стандартларни калибровкага, намуналарни беморларга йўналтириш"""
+    standards = df[(df['Роль'] == 'Стандарт') & df['Концентрация'].notna()]
+    standards = (
+        standards.groupby('Концентрация', as_index=False)['Оптик зичлик'].mean()
+        .dropna()
+        .sort_values('Оптик зичлик')
+    )
+    if len(standards) < 3:
+        raise ValueError("Калибровка учун камида 3 та стандарт керак")
+    
+    calib = make_calibration(
+        hormone_name,
+        unit,
+        standards['Оптик зичлик'].round(4),
+        standards['Концентрация']
+    )
+    
+    samples = df[df['Роль'] == 'Намуна'].dropna(subset=['Оптик зичлик'])
+    samples = samples.assign(Жой=samples['Планшет'] + ':' + samples['Лунка'])
+    grouped = samples.groupby('ID', sort=False).agg(
+        od=('Оптик зичлик', 'mean'),
+        wells=('Жой', ', '.join)
+    )
+    patients = pd.DataFrame({
+        'ID': grouped.index.astype(str),
+        f'Оптик зичлик ({hormone_name})': grouped['od'].round(4).to_numpy(),
+        'Изоҳ': grouped['wells'].to_numpy()
+    }).to_dict('records')
+    
+    start_run()
+    set_calibration(calib)
+    st.session_state['patients'] = patients
+    get_audit_log().log(
+        'import',
+        sample_ids=[p['ID'] for p in patients],
+        run_id=st.session_state['run_id'],
+        plates=int(df['Планшет'].nunique()),
+        wells=len(df)
+    )
+    st.session_state['patients_imported'] = True
+    st.session_state['plate_import'] = df
+    
+    controls = df[(df['Роль'] == 'Назорат')].groupby('ID')['Оптик зичлик'].mean().dropna()
+    record_qc_run(calib, controls.to_dict())
+    
+    return len(standards), len(patients)
+
+# ==================== ПЛАНШЕТ СИМУЛЯТОРИ ====================
+SIMULATOR_DEFAULTS = {
+    'replicates': WORKLIST_REPLICATES,
+    'od_sd': UNCERTAINTY_DEFAULTS['od_sd'],
+    'pipetting_cv': UNCERTAINTY_DEFAULTS['pipetting_cv'],
+    'plate_cv': 0.02,      # планшетлар орасидаги умумий сигнал фарқи
+    'edge_effect': 0.05,   # чекка лункаларда буғланиш туфайли OD ошиши
+    'seed': 42
+}
+# Калибровка йўқ бўлганда ишлатиладиган 4PL эгри чизиғи: (A, B, C, D) ва стандартлар
+SIMULATOR_DEFAULT_CURVE = ((0.05, 1.2, 20.0, 2.5), (0, 2.5, 5, 10, 20, 40, 80))
+
+def four_parameter_logistic(concentration, a, b, c, d):
+    """4PL модели: A - нол дозадаги OD, D - тўйинган OD, C - EC50, B - тиклик"""
+    with np.errstate(divide='ignore'):
+        return d + (a - d) / (1 + (np.asarray(concentration, dtype=float) / c)**b)
+
+def simulation_curves(calibrations):
+    """Гормон -> (стандартлар, концентрация -> OD функцияси); панел бўш бўлса 4PL"""
+    if not calibrations:
+        params, standards = SIMULATOR_DEFAULT_CURVE
+        return {None: (np.array(standards, dtype=float), lambda c: four_parameter_logistic(c, *params))}
+    
+    calibrator = get_panel_calibrator(calibration_key(calibrations))
+    curves = {}
+    for hormone, calib in calibrations.items():
+        # Монотон бўлмаган (бир концентрацияга бир нечта OD) қисмлар симуляцияга олинмайди
+        table = calibrator.calibration_data[hormone]['table']
+        valid = ~np.isnan(table['slope'])
+        if valid.sum() < 2:
+            raise ValueError(f"{hormone}: калибровка эгри чизиғи монотон эмас")
+        table = {name: table[name][valid] for name in ('concentration', 'optic_density', 'slope')}
+        
+        def curve(c, table=table):
+            # Жадвал ташқарисида четки қиялик бўйича чизиқли давом эттириш
+            low, high = table['concentration'][[0, -1]]
+            od = np.interp(c, table['concentration'], table['optic_density'])
+            od += np.minimum(c - low, 0) * table['slope'][0] + np.maximum(c - high, 0) * table['slope'][-1]
+            return od
+        
+        curves[hormone] = (np.sort(np.asarray(calib['concentration'], dtype=float)), curve)
+    return curves
+
+def simulate_plates(curves, n_samples, plate_shape=PLATE_WELLS, **settings):
+    """Кўп гормонли планшетларни битта векторли ўтишда симуляция қилиш; (беморлар, лункалар)"""
+    settings = {**SIMULATOR_DEFAULTS, **settings}
+    replicates = settings['replicates']
+    rng = np.random.default_rng(settings['seed'])
+    
+    # Чекка лункалар ниқоби plate_layout даги устун бўйича тартибда
+    n_rows, n_cols = plate_shape
+    edge = np.ones((n_rows, n_cols), dtype=bool)
+    edge[1:-1, 1:-1] = False
+    edge = edge.T.ravel()
+    
+    sample_ids = 'P' + pd.Series(np.arange(1, n_samples + 1)).astype(str).str.zfill(3)
+    patients = pd.DataFrame({'ID': sample_ids})
+    frames = []
+    
+    for hormone, (standards, curve) in curves.items():
+        wells, reserved, capacity = plate_layout(hormone, len(standards), replicates, plate_shape)
+        n_plates = -(-n_samples // capacity)
+        
+        # Ҳақиқий концентрациялар: стандартлар диапазони атрофида лог-нормал
+        positive = standards[standards > 0]
+        log_low, log_high = np.log(positive[0]), np.log(standards[-1])
+        true_conc = np.exp(rng.normal((log_low + log_high) / 2, (log_high - log_low) / 4, n_samples))
+        
+        # Лунка ўринлари: ҳар бир планшет бошида стандартлар, кейин намуналар (такрорлар ёнма-ён)
+        sample = np.arange(n_samples)
+        sample_plate = sample // capacity
+        sample_pos = reserved + (sample % capacity)[:, None] * replicates + np.arange(replicates)
+        std_pos = np.broadcast_to(np.arange(reserved).reshape(len(standards), replicates), (n_plates, len(standards), replicates))
+        std_plate = np.broadcast_to(np.arange(n_plates)[:, None, None], std_pos.shape)
+        
+        plate_gain = 1 + settings['plate_cv'] * rng.standard_normal(n_plates)
+        
+        def observe(true_od, plate, pos):
+            signal = true_od * plate_gain[plate] * (1 + settings['edge_effect'] * edge[pos])
+            signal = signal * (1 + settings['pipetting_cv'] * rng.standard_normal(pos.shape))
+            return np.maximum(signal + settings['od_sd'] * rng.standard_normal(pos.shape), 0)
+        
+        sample_od = observe(curve(true_conc)[:, None], sample_plate[:, None], sample_pos)
+        std_od = observe(curve(standards)[None, :, None], std_plate, std_pos)
+        
+        # Гормон маълум бўлса доим унинг устуни: кейин қўшилган калибровкага бу OD тушмайди
+        column = f'Оптик зичлик ({hormone})' if hormone is not None else 'Оптик зичлик'
+        patients[column] = sample_od.mean(axis=1)
+        
+        frames.append(pd.DataFrame({
+            'Гормон': hormone,
+            'Планшет': np.concatenate([std_plate.ravel(), np.repeat(sample_plate, replicates)]) + 1,
+            'Лунка': wells[np.concatenate([std_pos.ravel(), sample_pos.ravel()])],
+            'ID': np.concatenate([
+                np.tile(np.repeat([f"STD:{c:g}" for c in standards], replicates), n_plates),
+                np.repeat(sample_ids.to_numpy(), replicates)
+            ]),
+            'Роль': np.repeat(['Стандарт', 'Намуна'], [std_pos.size, sample_pos.size]),
+            'Оптик зичлик': np.concatenate([std_od.ravel(), sample_od.ravel()]),
+            'Концентрация': np.concatenate([np.broadcast_to(standards[None, :, None], std_pos.shape).ravel(), np.full(sample_pos.size, np.nan)]),
+            'Ҳақиқий концентрация': np.concatenate([
+                np.broadcast_to(standards[None, :, None], std_pos.shape).ravel(),
+                np.repeat(true_conc, replicates)
+            ])
+        }))
+    
+    return patients, pd.concat(frames, ignore_index=True)
 
 # ==================== СТРИМЛИТ ВИДЖЕТЛАРИ ====================
+def show_qc_flags(qc_eval):
+    """Westgard қоидалари натижаларини кўрсатиш"""
+    for series, result in qc_eval.items():
+        flags = result['flags']
+        if any(flag in QC_REJECT_RULES for flag in flags):
+            st.error(f"⛔ QC {series}: {', '.join(flags)} (z = {result['z']:.2f})")
+        elif flags:
+            st.warning(f"⚠️ QC {series}: {', '.join(flags)} (z = {result['z']:.2f})")
+
 def show_sidebar():
     """Сайдбарни кўрсатиш"""
     with st.sidebar:
@@ -295,7 +1836,8 @@ def show_sidebar():
             "📊 Интерполяция усули",
             ["linear", "cubic", "spline"],
             index=0,
-            help="Линей - содда, Кубик - аниқ, Сплайн - мураккаб"
+            help="Линей - содда, Кубик - аниқ, Сплайн - мураккаб",
+            key='interp_method'
         )
         
         # Статистика қўрсатиш
@@ -319,14 +1861,20 @@ def show_sidebar():
             st.session_state['standards'] = data
             st.success(f"{sample_hormone} намунаси юкланди!")
         
+        if st.button("🧪 Бутун панелни юклаш", use_container_width=True):
+            start_run()
+            for name, data in sample_data.items():
+                set_calibration(make_calibration(name, data['unit'], data['optic_density'], data['concentration']))
+            st.success(f"{len(sample_data)} гормонли панел калибровка қилинди!")
+        
         st.markdown("---")
         
         # Файл юклаш
         st.markdown("### 📁 Маълумотларни юклаш")
         uploaded_file = st.file_uploader(
-            "JSON ёки CSV файл юкланг",
-            type=['json', 'csv'],
-            help="Стандартлар ёки беморлар маълумотлари"
+            "JSON, CSV, Excel ёки снапшот (.blp) файл юкланг",
+            type=['json', 'csv', 'xlsx', 'xls', 'blp'],
+            help="Стандартлар ёки беморлар маълумотлари. Excel: планшет варақлари (8×12 ёки 16×24) ва Layout варағи"
         )
         
         if uploaded_file is not None:
@@ -334,6 +1882,22 @@ def show_sidebar():
                 if uploaded_file.name.endswith('.json'):
                     data = json.load(uploaded_file)
                     st.session_state.update(data)
+                elif uploaded_file.name.endswith('.blp'):
+                    if st.session_state.get('snapshot_file_id') != uploaded_file.file_id:
+                        snapshot = load_session_snapshot(uploaded_file.getvalue())
+                        st.session_state['snapshot_file_id'] = uploaded_file.file_id
+                        st.info(f"Снапшот ({snapshot.meta['created']}): {', '.join(snapshot.sections)}")
+                elif uploaded_file.name.lower().endswith(('.xlsx', '.xls')):
+                    # Гормон ва бирлик аниқланмагунча импорт қилинмайди: калибровка ва QC ёзуви қайтарилмайди
+                    with st.form("plate_import_form"):
+                        import_hormone = st.text_input("Гормон номи (Excel)", "Кортизол")
+                        import_unit = st.text_input("Ўлчов бирлиги (Excel)", "нг/мл")
+                        submitted = st.form_submit_button("📥 Импорт", use_container_width=True)
+                    
+                    if submitted:
+                        plate_df = parse_plate_workbook(uploaded_file.getvalue(), uploaded_file.name)
+                        n_standards, n_patients = route_plate_import(plate_df, import_hormone, import_unit)
+                        st.info(f"{plate_df['Планшет'].nunique()} планшет: {n_standards} стандарт, {n_patients} бемор")
                 else:
                     data = pd.read_csv(uploaded_file)
                     st.session_state['patient_data'] = data.to_dict('records')
@@ -397,6 +1961,10 @@ def calibration_tab(tab):
                 value=5,
                 step=1
             )
+            
+            with st.expander("🧪 Назорат намуналари (QC)"):
+                qc_low_od = st.number_input("Назорат 1 (паст) OD", min_value=0.0, value=0.0, format="%.3f", key="qc_low_od")
+                qc_high_od = st.number_input("Назорат 2 (юқори) OD", min_value=0.0, value=0.0, format="%.3f", key="qc_high_od")
         
         with col2:
             st.markdown("**Стандарт қийматлари:**")
@@ -436,18 +2004,28 @@ def calibration_tab(tab):
                     optic_density = [row['Оптик зичлик'] for row in standards_data]
                     concentration = [row[f'Концентрация ({unit})'] for row in standards_data]
                     
-                    st.session_state['calibration'] = {
-                        'hormone': hormone_name,
-                        'unit': unit,
-                        'optic_density': optic_density,
-                        'concentration': concentration,
-                        'standards_df': df_standards
+                    calib = make_calibration(
+                        hormone_name,
+                        unit,
+                        optic_density,
+                        concentration,
+                        method=st.session_state.get('interp_method', 'linear')
+                    )
+                    start_run()
+                    set_calibration(calib)
+                    
+                    # QC тренди: 0 киритилган назоратлар ўлчанмаган деб ҳисобланади
+                    control_ods = {
+                        name: od for name, od in [('Назорат 1', qc_low_od), ('Назорат 2', qc_high_od)] if od > 0
                     }
+                    qc_eval = record_qc_run(calib, control_ods)
                     
                     st.success(f"✅ {hormone_name} учун калибровка муваффақиятли амалга оширилди!")
+                    show_qc_flags(qc_eval)
         
         # Сақланган калибровкалар
-        if 'calibration' in st.session_state:
+        calibrations = get_calibrations()
+        if calibrations:
             st.markdown('<div class="custom-card"><h3>💾 Сақланган калибровкалар</h3></div>', unsafe_allow_html=True)
             
             calib = st.session_state['calibration']
@@ -458,7 +2036,24 @@ def calibration_tab(tab):
             with cols[1]:
                 st.metric("Ўлчов бирлиги", calib['unit'])
             with cols[2]:
-                st.metric("Стандартлар", len(calib['optic_density']))
+                st.metric("Панелдаги гормонлар", len(calibrations))
+            
+            calibrator = get_panel_calibrator(calibration_key(calibrations))
+            df_panel = pd.DataFrame([
+                {
+                    'Гормон': hormone,
+                    'Ўлчов бирлиги': c['unit'],
+                    'Стандартлар': len(c['optic_density']),
+                    'R²': calibrator.calibration_data[hormone]['regression']['r_squared']
+                }
+                for hormone, c in calibrations.items()
+            ])
+            st.dataframe(df_panel, use_container_width=True, hide_index=True)
+            
+            if st.button("🗑️ Панелни тозалаш", use_container_width=True):
+                calibrations.clear()
+                del st.session_state['calibration']
+                st.rerun()
 
 def patients_tab(tab):
     """Беморлар таби"""
@@ -479,15 +2074,14 @@ def patients_tab(tab):
         
         # Автоматик генерация
         if st.button("🎲 Намуна беморлар яратиш", use_container_width=True):
-            np.random.seed(42)
-            for i in range(num_patients):
-                patients_data.append({
-                    'ID': f"P{i+1:03d}",
-                    'Оптик зичлик': round(np.random.uniform(0.1, 0.6), 3),
-                    'Изоҳ': f"Намуна бемор {i+1}"
-                })
+            # Детерминистик планшет симуляцияси; қўлда киритиш майдонлари уни устма-уст ёзмаслиги учун импорт сифатида
+            patients_df, wells = simulate_plates(simulation_curves(get_calibrations()), int(num_patients))
+            patients_df = patients_df.round(3)
+            patients_df['Изоҳ'] = "Намуна бемор " + (patients_df.index + 1).astype(str)
+            patients_data = patients_df.to_dict('records')
             st.session_state['patients'] = patients_data
-            st.success(f"{num_patients} та намуна бемор яратилди!")
+            st.session_state['patients_imported'] = True
+            st.success(f"{num_patients} та намуна бемор яратилди ({wells['Планшет'].max()} та планшет, {len(wells)} та лунка)!")
         
         # Қўлда киритиш
         st.markdown("**Қўлда киритиш:**")
@@ -497,33 +2091,64 @@ def patients_tab(tab):
         if 'patients' not in st.session_state:
             st.session_state['patients'] = []
         
-        for i in range(num_patients):
-            cols = st.columns([1, 2, 3])
+        # Импорт қилинган беморлар (Excel, снапшот) қўлда киритиш майдонлари билан устма-уст ёзилмайди
+        if st.session_state.get('patients_imported'):
+            st.info(f"{len(st.session_state['patients'])} та бемор импорт қилинган")
+            if st.button("✏️ Қўлда киритишга қайтиш", use_container_width=True):
+                st.session_state['patients_imported'] = False
+                st.session_state['patients'] = []
+                st.rerun()
+        
+        # Ҳар бир калибрланган гормон учун алоҳида OD: кейин қўшилган гормонга бошқасининг OD си тушмайди
+        panel_hormones = list(get_calibrations())
+        
+        for i in range(0 if st.session_state.get('patients_imported') else num_patients):
+            cols = st.columns([1, 2, 1, 1, 1, 2])
             with cols[0]:
                 patient_id = st.text_input(f"ID {i+1}", value=f"P{i+1:03d}", key=f"pid_{i}")
             with cols[1]:
-                optic_density = st.number_input(
-                    f"Оптик зичлик {i+1}",
-                    min_value=0.0,
-                    value=0.2 + i*0.05,
-                    format="%.3f",
-                    key=f"p_od_{i}"
-                )
+                if panel_hormones:
+                    panel_ods = {
+                        f'Оптик зичлик ({hormone})': st.number_input(
+                            f"{hormone} OD {i+1}",
+                            min_value=0.0,
+                            value=0.2 + i*0.05,
+                            format="%.3f",
+                            key=f"p_od_{hormone}_{i}"
+                        )
+                        for hormone in panel_hormones
+                    }
+                else:
+                    panel_ods = {
+                        'Оптик зичлик': st.number_input(
+                            f"Оптик зичлик {i+1}",
+                            min_value=0.0,
+                            value=0.2 + i*0.05,
+                            format="%.3f",
+                            key=f"p_od_{i}"
+                        )
+                    }
             with cols[2]:
+                sex = st.selectbox(f"Жинс {i+1}", SEXES, key=f"sex_{i}")
+            with cols[3]:
+                age = st.number_input(f"Ёш {i+1}", min_value=0, max_value=AGE_LIMIT - 1, value=30, key=f"age_{i}")
+            with cols[4]:
+                phase = st.selectbox(f"Фаза {i+1}", CYCLE_PHASES, key=f"phase_{i}")
+            with cols[5]:
                 note = st.text_input(f"Изоҳ {i+1}", key=f"note_{i}")
             
+            patient = {
+                'ID': patient_id,
+                **panel_ods,
+                'Жинс': sex,
+                'Ёш': age,
+                'Фаза': phase,
+                'Изоҳ': note
+            }
             if i < len(st.session_state['patients']):
-                st.session_state['patients'][i] = {
-                    'ID': patient_id,
-                    'Оптик зичлик': optic_density,
-                    'Изоҳ': note
-                }
+                st.session_state['patients'][i] = patient
             else:
-                st.session_state['patients'].append({
-                    'ID': patient_id,
-                    'Оптик зичлик': optic_density,
-                    'Изоҳ': note
-                })
+                st.session_state['patients'].append(patient)
         
         if st.session_state['patients']:
             df_patients = pd.DataFrame(st.session_state['patients'])
@@ -532,28 +2157,29 @@ def patients_tab(tab):
             # Статистика
             st.markdown('<div class="custom-card"><h3>📊 Беморлар статистикаси</h3></div>', unsafe_allow_html=True)
             
-            optic_values = [p['Оптик зичлик'] for p in st.session_state['patients']]
+            od_matrix = patient_od_matrix(st.session_state['patients'], list(get_calibrations()) or [None])
+            optic_values = od_matrix[~np.isnan(od_matrix)]
             
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Жами беморлар", len(optic_values))
+                st.metric("Жами беморлар", len(st.session_state['patients']))
             with col2:
-                st.metric("Ўртача зичлик", f"{np.mean(optic_values):.3f}")
+                st.metric("Ўртача зичлик", f"{np.mean(optic_values):.3f}" if optic_values.size else "-")
             with col3:
-                st.metric("Минимал", f"{min(optic_values):.3f}")
+                st.metric("Минимал", f"{np.min(optic_values):.3f}" if optic_values.size else "-")
             with col4:
-                st.metric("Максимал", f"{max(optic_values):.3f}")
+                st.metric("Максимал", f"{np.max(optic_values):.3f}" if optic_values.size else "-")
 
 def visualization_tab(tab):
     """График таби"""
     with tab:
         st.markdown('<div class="custom-card"><h3>📈 Визуализация ва график</h3></div>', unsafe_allow_html=True)
         
-        if 'calibration' not in st.session_state:
+        if not get_calibrations():
             st.warning("Аввал калибровка маълумотларини киритинг!")
             return
         
-        calib = st.session_state['calibration']
+        calib = select_calibration('viz_hormone')
         
         # Калибровка графиги
         fig = make_subplots(
@@ -638,7 +2264,7 @@ def visualization_tab(tab):
         fig.add_trace(
             go.Scatter(
                 x=np.sort(residuals),
-                y=np.sort(np.random.normal(0, 1, len(residuals))),
+                y=normal_quantiles(len(residuals)),
                 mode='markers',
                 name='Q-Q plot',
                 marker=dict(size=8, color='#ff6b6b')
@@ -661,18 +2287,13 @@ def visualization_tab(tab):
         if 'patients' in st.session_state and st.session_state['patients']:
             st.markdown('<div class="custom-card"><h3>👥 Беморлар таҳлили</h3></div>', unsafe_allow_html=True)
             
-            # Беморлар концентрациясини ҳисоблаш
-            calibrator = HormoneCalibrator()
-            calibrator.add_standard(
-                calib['hormone'],
-                calib['optic_density'],
-                calib['concentration'],
-                calib['unit']
-            )
-            calibrator.calibrate(calib['hormone'])
-            
-            patient_od = [p['Оптик зичлик'] for p in st.session_state['patients']]
-            predictions, status = calibrator.predict(calib['hormone'], patient_od)
+            # Беморлар концентрациясини бутун панел бўйича ҳисоблаш
+            hormones, od, predictions, status, range_status = evaluate_panel(get_calibrations(), st.session_state['patients'])
+            j = hormones.index(calib['hormone'])
+            measured = ~np.isnan(od[:, j])
+            patient_ids = pd.DataFrame(st.session_state['patients'])['ID'].to_numpy()[measured]
+            patient_od, predictions, status = od[measured, j], predictions[measured, j], status[measured, j]
+            range_status = range_status[measured, j]
             
             # Беморлар графиги
             fig_patients = go.Figure()
@@ -688,9 +2309,16 @@ def visualization_tab(tab):
                         y=predictions[mask],
                         mode='markers',
                         name=f'Беморлар ({label})',
-                        marker=dict(size=15, color=color, line=dict(width=2, color='white')),
-                        text=[st.session_state['patients'][i]['ID'] for i in range(len(mask)) if mask[i]],
-                        hovertemplate='ID: %{text}<br>Оптик: %{x:.3f}<br>Конц: %{y:.2f}'
+                        # Калибровка диапазонидан ташқари (экстраполяция) нуқталар × билан
+                        marker=dict(
+                            size=15,
+                            color=color,
+                            symbol=np.where(range_status[mask] != 0, 'x', 'circle'),
+                            line=dict(width=2, color='white')
+                        ),
+                        text=patient_ids[mask],
+                        customdata=RANGE_LABELS[range_status[mask] + 1],
+                        hovertemplate='ID: %{text}<br>Оптик: %{x:.3f}<br>Конц: %{y:.2f}<br>Диапазон: %{customdata}'
                     ))
             
             fig_patients.update_layout(
@@ -702,17 +2330,75 @@ def visualization_tab(tab):
             )
             
             st.plotly_chart(fig_patients, use_container_width=True)
+        
+        # Прецизион профили ва клиник қарор чегаралари
+        st.markdown('<div class="custom-card"><h3>📐 Прецизион профили</h3></div>', unsafe_allow_html=True)
+        
+        calibrations = get_calibrations()
+        calibrator = get_panel_calibrator(calibration_key(calibrations))
+        
+        ambiguous = [
+            hormone for hormone in calibrations
+            if not calibrator.calibration_data[hormone]['table']['monotonic']
+        ]
+        if ambiguous:
+            st.warning(
+                f"⚠️ {', '.join(ambiguous)}: калибровка эгри чизиғи монотон эмас - "
+                "бир нечта OD га мос келадиган концентрациялар учун тескари қиймат ва CV кўрсатилмайди"
+            )
+        
+        fig_profile = go.Figure()
+        for hormone in calibrations:
+            concentration, cv = calibrator.precision_profile(hormone)
+            fig_profile.add_trace(go.Scatter(
+                x=concentration,
+                y=cv,
+                mode='lines',
+                name=f"{hormone} ({calibrations[hormone]['unit']})",
+                hovertemplate='Конц: %{x:.2f}<br>CV: %{y:.1f}%'
+            ))
+        fig_profile.add_hline(y=20, line_dash='dot', line_color='#f5576c')
+        fig_profile.update_layout(
+            title="Концентрация бўйича кутилаётган CV",
+            xaxis_title="Концентрация",
+            xaxis_type='log',
+            yaxis_title="CV (%)",
+            yaxis_range=[0, 50],
+            template='plotly_white',
+            height=450
+        )
+        st.plotly_chart(fig_profile, use_container_width=True)
+        
+        decision_limits = st.text_input(
+            f"Клиник қарор чегаралари ({calib['hormone']}, {calib['unit']}), вергул билан",
+            value=', '.join(f"{c:g}" for c in np.percentile(calib['concentration'], [25, 75])),
+            key='decision_limits'
+        )
+        try:
+            limits = np.array([float(v) for v in decision_limits.replace(';', ',').split(',') if v.strip()])
+        except ValueError:
+            st.error("❌ Чегараларни сон сифатида киритинг!")
+            limits = np.array([])
+        
+        if limits.size:
+            profile_conc, profile_cv = calibrator.precision_profile(calib['hormone'])
+            st.dataframe(pd.DataFrame({
+                'Чегара': limits,
+                'Оптик зичлик': calibrator.optic_density_for(calib['hormone'], limits),
+                'Қиялик (dOD/dC)': calibrator.local_slope(calib['hormone'], limits),
+                'CV %': np.interp(limits, profile_conc, profile_cv, left=np.nan, right=np.nan)
+            }).round(4), use_container_width=True, hide_index=True)
 
 def statistics_tab(tab):
     """Статистика таби"""
     with tab:
         st.markdown('<div class="custom-card"><h3>📊 Батафсил статистика</h3></div>', unsafe_allow_html=True)
         
-        if 'calibration' not in st.session_state:
+        if not get_calibrations():
             st.warning("Аввал калибровка маълумотларини киритинг!")
             return
         
-        calib = st.session_state['calibration']
+        calib = select_calibration('stats_hormone')
         
         # Регрессия статистикаси
         slope, intercept, r_value, p_value, std_err = stats.linregress(
@@ -763,37 +2449,218 @@ def statistics_tab(tab):
         )
         st.plotly_chart(fig_corr, use_container_width=True)
         
+        # Вазнли регрессия
+        st.markdown('<div class="custom-card"><h3>⚖️ Вазнли регрессия</h3></div>', unsafe_allow_html=True)
+        
+        x = np.atleast_2d(calib['optic_density'])
+        y = np.atleast_2d(calib['concentration'])
+        df_weighted = pd.DataFrame([
+            {
+                'Вазн': weighting,
+                'Қиялик': fit['slope'][0],
+                'Кесишма': fit['intercept'][0],
+                'R²': fit['r_squared'][0],
+                'Қиялик хатоси': fit['std_err'][0]
+            }
+            for weighting, fit in (
+                (weighting, weighted_regression_batch(x, y, weighting)) for weighting in WEIGHTING_SCHEMES
+            )
+        ])
+        st.dataframe(df_weighted, use_container_width=True, hide_index=True)
+        
+        # Импорт қилинган планшетлар бўйича барча эгри чизиқлар битта ечимда
+        plate_df = st.session_state.get('plate_import')
+        if plate_df is not None and plate_df['Планшет'].nunique() > 1:
+            plates, x_plates, y_plates = plate_standard_matrix(plate_df)
+            weighting = st.selectbox("Вазн схемаси (планшетлар)", WEIGHTING_SCHEMES, index=2)
+            fit = weighted_regression_batch(x_plates, y_plates, weighting)
+            
+            df_plates = pd.DataFrame({
+                'Планшет': plates,
+                'Қиялик': fit['slope'],
+                'Кесишма': fit['intercept'],
+                'R²': fit['r_squared'],
+                'Стандартлар': fit['n']
+            })
+            
+            fig_plates = go.Figure(go.Scatter(
+                x=df_plates['Планшет'],
+                y=df_plates['Қиялик'],
+                mode='markers',
+                error_y=dict(type='data', array=fit['std_err']),
+                marker=dict(size=8, color='#667eea')
+            ))
+            fig_plates.update_layout(
+                title=f"Планшетлар бўйича қиялик ({weighting})",
+                xaxis_title="Планшет",
+                yaxis_title="Қиялик",
+                template='plotly_white',
+                height=400
+            )
+            st.plotly_chart(fig_plates, use_container_width=True)
+            st.dataframe(df_plates, use_container_width=True, hide_index=True)
+        
         # Беморлар статистикаси
         if 'patients' in st.session_state and st.session_state['patients']:
             st.markdown('<div class="custom-card"><h3>👥 Беморлар статистикаси</h3></div>', unsafe_allow_html=True)
             
-            patient_od = [p['Оптик зичлик'] for p in st.session_state['patients']]
-            
             # Ҳисоблаш
-            calibrator = HormoneCalibrator()
-            calibrator.add_standard(
-                calib['hormone'],
-                calib['optic_density'],
-                calib['concentration'],
-                calib['unit']
-            )
-            calibrator.calibrate(calib['hormone'])
-            predictions, status = calibrator.predict(calib['hormone'], patient_od)
+            hormones, od, predictions, status, range_status = evaluate_panel(get_calibrations(), st.session_state['patients'])
+            j = hormones.index(calib['hormone'])
+            measured = ~np.isnan(od[:, j])
+            predictions, status, range_status = predictions[measured, j], status[measured, j], range_status[measured, j]
             
-            # Статистика
-            stats_data = {
-                'Жами беморлар': len(predictions),
-                'Нормал диапазон': int(np.sum(status == 0)),
-                'Пастки диапазон': int(np.sum(status == -1)),
-                'Юкори диапазон': int(np.sum(status == 1)),
-                'Ўртача концентрация': f"{np.nanmean(predictions):.2f}",
-                'Стандарт оғиш': f"{np.nanstd(predictions):.2f}",
-                'Минимал': f"{np.nanmin(predictions):.2f}",
-                'Максимал': f"{np.nanmax(predictions):.2f}"
-            }
+            if not measured.any():
+                st.info(f"{calib['hormone']} учун беморларда OD ўлчанмаган")
+            else:
+                # Статистика
+                stats_data = {
+                    'Жами беморлар': len(predictions),
+                    'Нормал диапазон': int(np.sum(status == 0)),
+                    'Пастки диапазон': int(np.sum(status == -1)),
+                    'Юкори диапазон': int(np.sum(status == 1)),
+                    'Экстраполяция': int(np.sum(range_status != 0)),
+                    'Ўртача концентрация': f"{np.nanmean(predictions):.2f}",
+                    'Стандарт оғиш': f"{np.nanstd(predictions):.2f}",
+                    'Минимал': f"{np.nanmin(predictions):.2f}",
+                    'Максимал': f"{np.nanmax(predictions):.2f}"
+                }
+                
+                df_stats = pd.DataFrame(list(stats_data.items()), columns=['Кўрсаткич', 'Қиймат'])
+                st.dataframe(df_stats, use_container_width=True, hide_index=True)
+        
+        # QC тренди (Levey-Jennings)
+        store = get_qc_store()
+        qc_series = store.series(calib['hormone'])
+        if qc_series:
+            st.markdown('<div class="custom-card"><h3>📉 QC тренди (Levey-Jennings)</h3></div>', unsafe_allow_html=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                series = st.selectbox("Серия", qc_series)
+            with col2:
+                days = st.selectbox("Давр (кун)", [30, 90, 365], index=1)
+            
+            history = store.history(calib['hormone'], series, since=datetime.now() - pd.Timedelta(days=days))
+            mean, sd = store.target(calib['hormone'], series)
+            
+            fig_lj = go.Figure()
+            fig_lj.add_trace(go.Scatter(
+                x=history['run_time'],
+                y=history['value'],
+                mode='lines+markers',
+                name=series,
+                marker=dict(size=8, color='#667eea'),
+                line=dict(color='#667eea', width=2)
+            ))
+            
+            flagged = history[history['flags'] != '']
+            if not flagged.empty:
+                fig_lj.add_trace(go.Scatter(
+                    x=flagged['run_time'],
+                    y=flagged['value'],
+                    mode='markers',
+                    name='Westgard',
+                    marker=dict(size=14, color='#ff6b6b', symbol='x'),
+                    text=flagged['flags'],
+                    hovertemplate='%{text}<br>%{y:.3f}'
+                ))
+            
+            if sd is not None:
+                for k, color in [(0, '#43e97b'), (1, '#ffd93d'), (2, '#f5576c'), (3, '#764ba2')]:
+                    for sign in ([1, -1] if k else [1]):
+                        fig_lj.add_hline(y=mean + sign * k * sd, line_dash='dot' if k else 'solid', line_color=color)
             
-            df_stats = pd.DataFrame(list(stats_data.items()), columns=['Кўрсаткич', 'Қиймат'])
-            st.dataframe(df_stats, use_container_width=True, hide_index=True)
+            fig_lj.update_layout(
+                title=f"{calib['hormone']}: {series}",
+                xaxis_title="Сана",
+                yaxis_title=series,
+                template='plotly_white',
+                height=450
+            )
+            st.plotly_chart(fig_lj, use_container_width=True)
+        
+        # Кит лотларини солиштириш
+        st.markdown('<div class="custom-card"><h3>🧪 Кит лотларини солиштириш</h3></div>', unsafe_allow_html=True)
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            lot_name = st.text_input("Жорий калибровка лот рақами", key='lot_name')
+        with col2:
+            st.write("")
+            st.write("")
+            if st.button("💾 Лотни сақлаш", use_container_width=True):
+                if lot_name.strip():
+                    store.save_lot(calib['hormone'], lot_name.strip(), calib['optic_density'], calib['concentration'])
+                    get_audit_log().log(
+                        'lot',
+                        run_id=st.session_state.get('run_id'),
+                        hormone=calib['hormone'],
+                        lot=lot_name.strip()
+                    )
+                    st.success(f"✅ {lot_name.strip()} лоти сақланди")
+                else:
+                    st.error("❌ Лот рақамини киритинг!")
+        
+        lots = store.lots(calib['hormone'])
+        if len(lots) < 2:
+            st.info("Солиштириш учун камида иккита лот сақланг")
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            reference_lot = st.selectbox("Референт лот", lots['lot'], index=len(lots) - 1)
+        with col2:
+            lot_weighting = st.selectbox("Вазн схемаси (лотлар)", WEIGHTING_SCHEMES, key='lot_weighting')
+        
+        summary, grid, bias = compare_lots(lots, reference_lot, lot_weighting)
+        st.dataframe(
+            summary.style.format({
+                'Қиялик': '{:.4f}',
+                'Кесишма': '{:.4f}',
+                'R²': '{:.4f}',
+                'Қиялик p (TOST)': '{:.4f}',
+                'Кесишма p (TOST)': '{:.4f}',
+                'Ўртача силжиш %': '{:+.2f}',
+                'Макс. |силжиш| %': '{:.2f}'
+            }, na_rep='-'),
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption(
+            f"Эквивалент: қиялик ва кесишма ±{LOT_EQUIVALENCE_MARGIN:.0%} ичида (TOST, p < 0.05) "
+            f"ва ўлчов диапазонида |силжиш| ≤ {LOT_BIAS_LIMIT:.0f}%"
+        )
+        
+        fig_lots = go.Figure()
+        for i, lot in enumerate(summary['Лот']):
+            fig_lots.add_trace(go.Scatter(
+                x=grid,
+                y=bias[i],
+                mode='lines',
+                name=lot,
+                line=dict(width=3 if lot == reference_lot else 1.5)
+            ))
+        for sign in (1, -1):
+            fig_lots.add_hline(y=sign * LOT_BIAS_LIMIT, line_dash='dot', line_color='#f5576c')
+        fig_lots.update_layout(
+            title=f"{calib['hormone']}: {reference_lot} лотига нисбатан силжиш",
+            xaxis_title="Оптик зичлик",
+            yaxis_title="Силжиш (%)",
+            template='plotly_white',
+            height=450
+        )
+        st.plotly_chart(fig_lots, use_container_width=True)
+
+def log_export(export_format, sections, sample_ids, run_id):
+    """Юклаб олиш тугмаси босилганда экспортни аудит журналига ёзиш"""
+    get_audit_log().log(
+        'export',
+        sample_ids=sample_ids,
+        run_id=run_id,
+        format=export_format,
+        sections=sections
+    )
 
 def export_tab(tab):
     """Экспорт таби"""
@@ -817,7 +2684,7 @@ def export_tab(tab):
         with col1:
             export_format = st.radio(
                 "Файл формати",
-                ["CSV", "Excel", "JSON", "PDF"],
+                ["CSV", "Excel", "JSON", "PDF", "Снапшот"],
                 horizontal=True
             )
         
@@ -828,55 +2695,72 @@ def export_tab(tab):
                 index=1
             )
         
+        with st.expander("🎲 Ўлчов ноаниқлиги (Монте-Карло)"):
+            with_uncertainty = st.checkbox("Натижаларга ноаниқлик интервалларини қўшиш", value=False)
+            cols = st.columns(3)
+            with cols[0]:
+                od_sd = st.number_input("Ридер шовқини (OD SD)", min_value=0.0, value=UNCERTAINTY_DEFAULTS['od_sd'], format="%.4f")
+            with cols[1]:
+                pipetting_cv = st.number_input("Пипетлаш CV (%)", min_value=0.0, value=100 * UNCERTAINTY_DEFAULTS['pipetting_cv'], format="%.1f")
+            with cols[2]:
+                n_draws = st.number_input("Симуляциялар сони", min_value=100, max_value=10000, value=UNCERTAINTY_DEFAULTS['n_draws'], step=100)
+        
         # Маълумотларни тайёрлаш
         export_data = {}
         
-        if 'calibration' in st.session_state and "Калибровка маълумотлари" in export_options:
-            calib = st.session_state['calibration']
+        calibrations = get_calibrations()
+        
+        if calibrations and "Калибровка маълумотлари" in export_options:
             export_data['calibration'] = {
-                'hormone': calib['hormone'],
-                'unit': calib['unit'],
-                'standards': calib['standards_df'].to_dict('records'),
+                'hormones': {hormone: calib['unit'] for hormone, calib in calibrations.items()},
+                'standards': pd.concat([
+                    pd.DataFrame({
+                        'Гормон': hormone,
+                        '№': np.arange(1, len(calib['optic_density']) + 1),
+                        'Оптик зичлик': calib['optic_density'],
+                        'Концентрация': calib['concentration'],
+                        'Бирлик': calib['unit']
+                    })
+                    for hormone, calib in calibrations.items()
+                ], ignore_index=True).to_dict('records'),
                 'timestamp': datetime.now().isoformat()
             }
         
         if 'patients' in st.session_state and "Беморлар рўйхати" in export_options:
             export_data['patients'] = st.session_state['patients']
         
-        # Ҳисобланган натижалар
-        if 'calibration' in st.session_state and 'patients' in st.session_state:
+        # Ҳисобланган натижалар (бутун панел битта ўтишда)
+        if calibrations and st.session_state.get('patients'):
             if "Ҳисобланган натижалар" in export_options:
-                calibrator = HormoneCalibrator()
-                calibrator.add_standard(
-                    st.session_state['calibration']['hormone'],
-                    st.session_state['calibration']['optic_density'],
-                    st.session_state['calibration']['concentration'],
-                    st.session_state['calibration']['unit']
-                )
-                calibrator.calibrate(st.session_state['calibration']['hormone'])
-                
-                patient_od = [p['Оптик зичлик'] for p in st.session_state['patients']]
-                predictions, status = calibrator.predict(
-                    st.session_state['calibration']['hormone'], 
-                    patient_od
-                )
-                
-                results = []
-                for i, (pred, stat) in enumerate(zip(predictions, status)):
-                    results.append({
-                        'ID': st.session_state['patients'][i]['ID'],
-                        'Оптик зичлик': patient_od[i],
-                        f'Концентрация ({st.session_state["calibration"]["unit"]})': pred,
-                        'Ҳолат': 'Нормал' if stat == 0 else 'Пастки' if stat == -1 else 'Юкори',
-                        'Изоҳ': st.session_state['patients'][i]['Изоҳ']
-                    })
-                
-                export_data['results'] = results
+                # Снапшотдан тикланган натижалар панел ўзгармаган бўлса қайта ҳисобланмайди
+                restore_snapshot_results()
+                state_key, results = st.session_state.get('snapshot_results', (None, None))
+                current_key = panel_state_key(calibrations, st.session_state['patients'])
+                if with_uncertainty:
+                    # Симуляция қиммат: панел ва созламалар ўзгармаса, олдинги натижа ишлатилади
+                    settings = {'od_sd': od_sd, 'pipetting_cv': pipetting_cv / 100, 'n_draws': int(n_draws)}
+                    cache_key = (current_key, tuple(sorted(settings.items())))
+                    cached_key, results = st.session_state.get('uncertainty_results', (None, None))
+                    if cached_key != cache_key:
+                        uncertainty = panel_uncertainty(calibrations, st.session_state['patients'], **settings)
+                        results = panel_results(calibrations, st.session_state['patients'], uncertainty)
+                        st.session_state['uncertainty_results'] = (cache_key, results)
+                elif state_key is None or state_key != current_key:
+                    results = panel_results(calibrations, st.session_state['patients'])
+                export_data['results'] = results.to_dict('records')
         
         # Экспорт қилиш
         if export_data:
             st.markdown('<div class="custom-card"><h3>📥 Юклаб олиш</h3></div>', unsafe_allow_html=True)
             
+            # Аудит фақат юклаб олиш тугмаси босилганда ёзилади (on_click)
+            patients = st.session_state.get('patients') or []
+            audit = {
+                'export_format': export_format,
+                'sample_ids': [p['ID'] for p in patients] if {'patients', 'results'} & set(export_data) else None,
+                'run_id': st.session_state.get('run_id')
+            }
+            
             if export_format == "CSV":
                 for name, data in export_data.items():
                     if name == 'calibration':
@@ -889,9 +2773,14 @@ def export_tab(tab):
                         df = pd.DataFrame(data)
                         csv = df.to_csv(index=False, encoding=encoding)
                     
-                    b64 = base64.b64encode(csv.encode()).decode()
-                    href = f'<a href="data:file/csv;base64,{b64}" download="{name}.csv">📥 {name}.csv юклаб олиш</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                    st.download_button(
+                        f"📥 {name}.csv юклаб олиш",
+                        csv.encode(encoding, errors='replace'),
+                        file_name=f"{name}.csv",
+                        mime='text/csv',
+                        on_click=log_export,
+                        kwargs={**audit, 'sections': [name]}
+                    )
             
             elif export_format == "Excel":
                 with pd.ExcelWriter('экспорт.xlsx', engine='openpyxl') as writer:
@@ -918,33 +2807,157 @@ def export_tab(tab):
                 with open('экспорт.xlsx', 'rb') as f:
                     excel_data = f.read()
                 
-                b64 = base64.b64encode(excel_data).decode()
-                href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="калибровка_экспорт.xlsx">📥 Excel файлини юклаб олиш</a>'
-                st.markdown(href, unsafe_allow_html=True)
+                st.download_button(
+                    "📥 Excel файлини юклаб олиш",
+                    excel_data,
+                    file_name="калибровка_экспорт.xlsx",
+                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                    on_click=log_export,
+                    kwargs={**audit, 'sections': list(export_data)}
+                )
             
             elif export_format == "JSON":
-                json_str = json.dumps(export_data, ensure_ascii=False, indent=2)
-                b64 = base64.b64encode(json_str.encode()).decode()
-                href = f'<a href="data:application/json;base64,{b64}" download="калибровка.json">📥 JSON файлини юклаб олиш</a>'
-                st.markdown(href, unsafe_allow_html=True)
+                json_str = json.dumps(export_data, ensure_ascii=False, separators=(',', ':'))
+                st.download_button(
+                    "📥 JSON файлини юклаб олиш",
+                    json_str.encode('utf-8'),
+                    file_name="калибровка.json",
+                    mime='application/json',
+                    on_click=log_export,
+                    kwargs={**audit, 'sections': list(export_data)}
+                )
+            
+            elif export_format == "Снапшот":
+                snapshot = build_session_snapshot(calibrations, st.session_state.get('patients', []))
+                st.download_button(
+                    f"📥 Сессия снапшотини юклаб олиш ({len(snapshot) / 1024:.1f} КБ)",
+                    snapshot,
+                    file_name="сессия.blp",
+                    mime='application/octet-stream',
+                    on_click=log_export,
+                    kwargs={**audit, 'sections': ['snapshot']}
+                )
+        
+        # Қайта ўлчаш рўйхати
+        if calibrations and st.session_state.get('patients'):
+            plan = plan_dilutions(calibrations, st.session_state['patients'])
+            if not plan.empty:
+                st.markdown('<div class="custom-card"><h3>🔁 Қайта ўлчаш рўйхати</h3></div>', unsafe_allow_html=True)
+                
+                replicates = st.number_input("Такрорлар сони", min_value=1, max_value=4, value=WORKLIST_REPLICATES)
+                worklist = pack_worklist(plan, calibrations, replicates)
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Диапазондан ташқари", len(plan))
+                with col2:
+                    st.metric("Суюлтириш керак", int((plan['Сабаб'] == 'Юқори').sum()))
+                with col3:
+                    st.metric("Планшетлар", worklist['Планшет'].nunique())
+                
+                st.dataframe(plan, use_container_width=True, hide_index=True)
+                st.markdown(
+                    create_download_link(worklist.assign(**{'Қайта OD': np.nan}), 'қайта_ўлчаш', '📥 Иш рўйхатини юклаб олиш'),
+                    unsafe_allow_html=True
+                )
+                
+                rerun_file = st.file_uploader(
+                    "Қайта ўлчаш натижалари (CSV)",
+                    type=['csv'],
+                    key='rerun_upload',
+                    help="Иш рўйхати 'Қайта OD' устуни тўлдирилган ҳолда"
+                )
+                if rerun_file is not None:
+                    try:
+                        merged = merge_rerun_results(
+                            panel_results(calibrations, st.session_state['patients']),
+                            pd.read_csv(rerun_file),
+                            calibrations,
+                            st.session_state['patients']
+                        )
+                        if st.session_state.get('audit_rerun_file') != rerun_file.file_id:
+                            st.session_state['audit_rerun_file'] = rerun_file.file_id
+                            get_audit_log().log(
+                                'rerun_merge',
+                                sample_ids=merged.loc[merged['Суюлтириш'] > 1, 'ID'].unique(),
+                                run_id=st.session_state.get('run_id'),
+                                file=rerun_file.name
+                            )
+                        
+                        st.dataframe(merged, use_container_width=True, hide_index=True)
+                        st.markdown(
+                            create_download_link(merged, 'тузатилган_натижалар', '📥 Тузатилган натижаларни юклаб олиш'),
+                            unsafe_allow_html=True
+                        )
+                    except Exception as e:
+                        st.error(f"Қайта ўлчаш натижаларини бирлаштиришда хатолик: {str(e)}")
+        
+        # Аудит журнали
+        st.markdown('<div class="custom-card"><h3>📜 Аудит журнали</h3></div>', unsafe_allow_html=True)
+        
+        audit_log = get_audit_log()
+        if audit_log.truncated_tail:
+            st.warning(f"⚠️ Журнал охиридаги чала ёзилган қатор ({audit_log.truncated_tail} байт) олиб ташланди")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            audit_sample = st.text_input("Намуна ID", key='audit_sample')
+        with col2:
+            audit_run = st.text_input("Иш (run) ID", key='audit_run')
+        if st.session_state.get('run_id'):
+            st.caption(f"Жорий иш ID: {st.session_state['run_id']}")
+        
+        if st.button("🔎 Тарихни кўрсатиш", use_container_width=True, disabled=not (audit_sample or audit_run)):
+            history = audit_log.history(sample_id=audit_sample or None, run_id=audit_run or None)
+            st.dataframe(history, use_container_width=True, hide_index=True)
+        
+        if st.button("🔐 Журнал яхлитлигини текшириш", use_container_width=True):
+            broken_seq = audit_log.verify()
+            if broken_seq is None:
+                st.success("✅ Хеш занжири бутун")
+            else:
+                st.error(f"⛔ Журнал #{broken_seq} ёзувидан бошлаб бузилган")
 
 # ==================== АСОСИЙ ДАСТУР ====================
+TAB_TIMINGS_PATH = os.environ.get('BIOLAB_TAB_TIMINGS')  # юклама синовида таблар ижро вақти ёзиладиган JSONL файл
+
+@st.cache_resource
+def get_tab_timings_lock():
+    """Сервердаги барча сессиялар учун битта ёзиш қулфи"""
+    return threading.Lock()
+
+def record_tab_timings(tab_timings):
+    """Таблар ижро вақтини rerun нинг сўров сатри билан файлга қўшиш"""
+    ctx = get_script_run_ctx()
+    line = json.dumps({'query': ctx.query_string if ctx else '', **tab_timings}) + '\n'
+    with get_tab_timings_lock(), open(TAB_TIMINGS_PATH, 'a', encoding='utf-8') as f:
+        f.write(line)
+
 def main():
     # CSS стилларини ижро этиш
     inject_custom_css()
     
     # Сайдбарни кўрсатиш
+    started = time.perf_counter()
     show_sidebar()
+    tab_timings = {'sidebar': time.perf_counter() - started}
     
     # Асосий дашборд
     tab1, tab2, tab3, tab4, tab5 = show_dashboard()
     
-    # Табларни кўрсатиш
-    calibration_tab(tab1)
-    patients_tab(tab2)
-    visualization_tab(tab3)
-    statistics_tab(tab4)
-    export_tab(tab5)
+    # Табларни кўрсатиш (юклама синовида ижро вақти файлга ёзилади)
+    for name, render_tab, tab in [
+        ('calibration', calibration_tab, tab1),
+        ('patients', patients_tab, tab2),
+        ('visualization', visualization_tab, tab3),
+        ('statistics', statistics_tab, tab4),
+        ('export', export_tab, tab5)
+    ]:
+        started = time.perf_counter()
+        render_tab(tab)
+        tab_timings[name] = time.perf_counter() - started
+    if TAB_TIMINGS_PATH:
+        record_tab_timings(tab_timings)
     
     # Футер
     st.markdown("---")
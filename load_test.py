@@ -0,0 +1,321 @@
+"""BioLab Pro учун юклама синови.
+
+Ҳар бир даража учун битта `streamlit run app.py` сервери ишга туширилади
+ва унга N та мижоз браузер каби WebSocket (/_stcore/stream) орқали бир
+вақтда уланади. Ҳар бир мижоз одатий иш оқимини бажаради (намуна панелни
+юклаш, калибровка, беморлар, экспорт ва юклаб олиш). Барча сессиялар
+битта сервер жараёнида ишлайди: умумий st.cache_resource (панел
+калибратори, QC омбори, аудит журнали) ва GIL учун рақобат ўлчанади.
+
+Rerun вақти мижозда (сўров юборилгандан script_finished гача), таблар
+вақти серверда BIOLAB_TAB_TIMINGS файлига ёзилади ва сўров сатри бўйича
+бирлаштирилади. Сессия бошига хотира - N та сессия уланган ҳолда сервер
+RSS ининг ўсиши / N. Истисно, узилиш ёки вақт чегараси билан тугаган
+rerun лар ўлчовларга қўшилмайди ва хато сифатида алоҳида саналади.
+
+    python load_test.py --sessions 1 5 10 20 --patients 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import parse_qsl, urlencode
+
+import numpy as np
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.websocket import WebSocketClosedError, websocket_connect
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+PERCENTILES = (50, 90, 99)
+# Виджет тури -> WidgetState даги қиймат майдони (браузер юборадиган шаклда)
+WIDGET_VALUE_FIELDS = {
+    'button': 'trigger_value',
+    'download_button': 'trigger_value',
+    'number_input': 'double_value',
+    'multiselect': 'int_array_value',
+    'radio': 'int_value',
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid):
+    """Сервер жараёнининг жорий RSS хотираси (МБ); ps уни КБ да беради (Linux ва macOS)"""
+    return int(subprocess.check_output(['ps', '-o', 'rss=', '-p', str(pid)])) / 2**10
+
+
+def start_server(workdir, tab_timings_path, timeout):
+    """Битта Streamlit серверини ишга тушириш ва соғлиқ текширувини кутиш"""
+    port = _free_port()
+    env = {
+        **os.environ,
+        'BIOLAB_TAB_TIMINGS': tab_timings_path,
+        'BIOLAB_AUDIT_LOG': os.path.join(workdir, 'load_test_audit.jsonl'),
+    }
+    env.setdefault('BIOLAB_QC_DB', os.path.join(workdir, 'load_test_qc.db'))
+    log_path = os.path.join(workdir, 'server.log')
+    with open(log_path, 'ab') as log:
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+                '--server.headless', 'true',
+                '--server.address', '127.0.0.1',
+                '--server.port', str(port),
+                '--server.fileWatcherType', 'none',
+                '--browser.gatherUsageStats', 'false',
+                # Катта хабарлар кэшланмасин: мижоз ref_hash ларни тиклай олмайди
+                '--global.minCachedMessageSize', '1e12',
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+
+    deadline = time.time() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1).close()
+            return server, port
+        except OSError:
+            if server.poll() is not None or time.time() > deadline:
+                server.kill()
+                raise RuntimeError(f"Сервер ишга тушмади, қаранг: {log_path}")
+            time.sleep(0.5)
+
+
+class BrowserSession:
+    """Битта браузер сессияси: rerun сўровлари ва виджет ҳолатлари WebSocket орқали"""
+
+    def __init__(self, session_id, port, timeout):
+        self.session_id = session_id
+        self.url = f'ws://127.0.0.1:{port}/_stcore/stream'
+        self.timeout = timeout
+        self.page_script_hash = ''
+        self.widgets = {}  # (тур, ёрлиқ) -> охирги rerun даги виджет
+        self.values = {}   # виджет ID -> (майдон, қиймат); браузердек ҳар сафар юборилади
+        self.ws = None
+
+    async def connect(self):
+        self.ws = await websocket_connect(self.url, max_message_size=2**30)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    def _widget(self, kind, label):
+        try:
+            return self.widgets[kind, label]
+        except KeyError:
+            raise RuntimeError(f"{kind} '{label}' топилмади") from None
+
+    def click(self, label, kind='button'):
+        return {self._widget(kind, label).id: ('trigger_value', True)}
+
+    def set_value(self, kind, label, value):
+        widget = self._widget(kind, label)
+        if kind == 'multiselect':
+            value = [list(widget.options).index(option) for option in value]
+        elif kind == 'radio':
+            value = list(widget.options).index(value)
+        self.values[widget.id] = (WIDGET_VALUE_FIELDS[kind], value)
+        return {}
+
+    async def rerun(self, query, triggers):
+        """Rerun сўраш ва скрипт муваффақиятли тугагунча хабарларни ўқиш; вақт (с)"""
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.query_string = query
+        client_state.page_script_hash = self.page_script_hash
+        for widget_id, (field, value) in {**self.values, **triggers}.items():
+            state = client_state.widget_states.widgets.add()
+            state.id = widget_id
+            if field == 'int_array_value':
+                state.int_array_value.data[:] = value
+            else:
+                setattr(state, field, value)
+
+        started = time.perf_counter()
+        await self.ws.write_message(message.SerializeToString(), binary=True)
+        deadline = started + self.timeout
+        while True:
+            data = await asyncio.wait_for(self.ws.read_message(), deadline - time.perf_counter())
+            if data is None:
+                raise RuntimeError("WebSocket уланиши узилди")
+            forward = ForwardMsg.FromString(data)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                # Ҳар бир скрипт ижроси янги дарахт юборади
+                self.page_script_hash = forward.new_session.page_script_hash
+                self.widgets = {}
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type == 'exception':
+                    raise RuntimeError(f"{element.exception.type}: {element.exception.message}")
+                if element_type in WIDGET_VALUE_FIELDS:
+                    widget = getattr(element, element_type)
+                    self.widgets.setdefault((element_type, widget.label), widget)
+            elif kind == 'script_finished':
+                if forward.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return time.perf_counter() - started
+                if forward.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("Скрипт компиляция хатоси билан тугади")
+                # FINISHED_EARLY_FOR_RERUN: st.rerun() дан кейин скрипт яна ишлайди
+
+    async def run_flow(self, patients, repeats):
+        """Одатий иш оқими; (ўлчовлар, хато) - хатодан кейинги қадамлар бажарилмайди"""
+        steps = [
+            ('open', lambda: {}),
+            ('load_panel', lambda: self.click("🧪 Бутун панелни юклаш")),
+            ('calibrate', lambda: self.click("🎯 Калибровкани бажариш")),
+            ('patients_count', lambda: self.set_value('number_input', "Беморлар сони", patients)),
+            ('patients_generate', lambda: self.click("🎲 Намуна беморлар яратиш")),
+            ('export_results', lambda: self.set_value(
+                'multiselect',
+                "Экспорт қилинадиган маълумотлар",
+                ["Калибровка маълумотлари", "Беморлар рўйхати", "Ҳисобланган натижалар"]
+            )),
+            ('export_json', lambda: self.set_value('radio', "Файл формати", "JSON")),
+            ('export_download', lambda: self.click("📥 JSON файлини юклаб олиш", kind='download_button')),
+        ]
+        steps += [('rerun', lambda: {})] * repeats
+
+        records = []
+        for index, (step, action) in enumerate(steps):
+            try:
+                query = urlencode({'session': self.session_id, 'index': index})
+                elapsed = await self.rerun(query, action())
+            except (RuntimeError, asyncio.TimeoutError, WebSocketClosedError) as error:
+                return records, {'session': self.session_id, 'step': step, 'error': str(error) or type(error).__name__}
+            records.append({'session': self.session_id, 'index': index, 'step': step, 'rerun': elapsed})
+        return records, None
+
+
+def read_tab_timings(path):
+    """Сервер ёзган таб вақтлари; битта сўровда бир нечта ижро бўлса охиргиси"""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['session', 'index'])
+    with open(path, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    for row in rows:
+        query = dict(parse_qsl(row.pop('query')))
+        row['session'], row['index'] = int(query.get('session', -1)), int(query.get('index', -1))
+    return pd.DataFrame(rows).drop_duplicates(['session', 'index'], keep='last')
+
+
+async def drive_level(n_sessions, port, server_pid, patients, repeats, timeout):
+    """Қиздириш, кейин N та сессияни битта серверда бир вақтда юргизиш"""
+    # Импортлар ва умумий кэшлар ўлчанадиган сессияларнинг вақти ва хотирасига қўшилмаслиги учун
+    warmup = BrowserSession(-1, port, timeout)
+    await warmup.connect()
+    _, error = await warmup.run_flow(patients, 0)
+    warmup.close()
+    if error:
+        raise RuntimeError(f"Қиздириш сессияси: {error['step']}: {error['error']}")
+
+    rss_before = _rss_mb(server_pid)
+    sessions = [BrowserSession(i, port, timeout) for i in range(n_sessions)]
+    await asyncio.gather(*(session.connect() for session in sessions))
+
+    started = time.time()
+    outcomes = await asyncio.gather(*(session.run_flow(patients, repeats) for session in sessions))
+    wall = time.time() - started
+
+    # Сессиялар ҳали уланган: хотира ўлчови уларнинг ҳолатини ўз ичига олади
+    rss_per_session = (_rss_mb(server_pid) - rss_before) / n_sessions
+    for session in sessions:
+        session.close()
+
+    records = [record for session_records, _ in outcomes for record in session_records]
+    errors = [error for _, error in outcomes if error]
+    return records, errors, rss_per_session, wall
+
+
+def run_level(n_sessions, patients, repeats, timeout, workdir):
+    """Янги серверда битта даражани ўлчаш ва таб вақтларини бирлаштириш"""
+    tab_timings_path = os.path.join(workdir, f'tab_timings_{n_sessions}.jsonl')
+    server, port = start_server(workdir, tab_timings_path, timeout)
+    try:
+        records, errors, rss_per_session, wall = asyncio.run(
+            drive_level(n_sessions, port, server.pid, patients, repeats, timeout)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    records = pd.DataFrame(records, columns=['session', 'index', 'step', 'rerun'])
+    records = records.merge(read_tab_timings(tab_timings_path), on=['session', 'index'], how='left')
+    records['sessions'] = n_sessions
+    level = {'sessions': n_sessions, 'wall_s': wall, 'errors': len(errors), 'rss_mb_per_session': rss_per_session}
+    return records.drop(columns='index'), errors, level
+
+
+def summarize(records, levels):
+    """Қадам ва таб бўйича вақт перцентиллари (мс)"""
+    timing_columns = [c for c in records.columns if c not in ('session', 'step', 'sessions')]
+    rows = []
+    for n_sessions, level in records.groupby('sessions'):
+        values = level[timing_columns].to_numpy(dtype=float) * 1000
+        pct = np.nanpercentile(values, PERCENTILES, axis=0)
+        for j, column in enumerate(timing_columns):
+            row = {'sessions': n_sessions, 'timing': column}
+            row.update({f'p{p}_ms': pct[i, j] for i, p in enumerate(PERCENTILES)})
+            rows.append(row)
+    summary = pd.DataFrame(rows)
+
+    levels = pd.DataFrame(levels)
+    levels.insert(2, 'reruns', levels['sessions'].map(records.groupby('sessions').size()).fillna(0).astype(int))
+    return summary, levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BioLab Pro битта сервердаги параллел сессиялар юклама синови")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10], help="Синаладиган параллел сессиялар сони")
+    parser.add_argument('--patients', type=int, default=50, help="Ҳар бир сессиядаги беморлар сони (1-100)")
+    parser.add_argument('--repeats', type=int, default=3, help="Экспортдан кейинги қўшимча rerun лар")
+    parser.add_argument('--timeout', type=float, default=120, help="Битта rerun учун вақт чегараси (с)")
+    parser.add_argument('--csv', help="Барча ўлчовларни CSV га ёзиш")
+    args = parser.parse_args()
+
+    # Аудит журнали ва QC омбори синов маълумотлари билан ифлосланмайди
+    workdir = tempfile.mkdtemp()
+
+    all_records, levels = [], []
+    for n_sessions in args.sessions:
+        records, errors, level = run_level(n_sessions, args.patients, args.repeats, args.timeout, workdir)
+        all_records.append(records)
+        levels.append(level)
+        print(f"{n_sessions} сессия: {len(records)} rerun, {len(errors)} хато, {level['wall_s']:.1f} с")
+        for error in errors:
+            print(f"  сессия {error['session']}, {error['step']}: {error['error']}")
+
+    records = pd.concat(all_records, ignore_index=True)
+    if records.empty:
+        print("\nЯкунланган rerun йўқ")
+        return
+    summary, levels = summarize(records, levels)
+
+    pd.set_option('display.width', 160)
+    print("\nRerun вақти перцентиллари (мс):")
+    print(summary.pivot(index='timing', columns='sessions', values=[f'p{p}_ms' for p in PERCENTILES]).round(1).to_string())
+    print("\nДаражалар (хотира - сервер RSS ининг сессия бошига ўсиши):")
+    print(levels.round(2).to_string(index=False))
+
+    if args.csv:
+        records.to_csv(args.csv, index=False)
+
+
+if __name__ == "__main__":
+    main()